@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return f"{revision}-dirty" if dirty.strip() else revision
+
+
+def measure(fn: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> dict[str, float]:
+    times: list[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            _ = setup()
+
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            _ = fn()
+            times.append((time.perf_counter() - start) * 1000)
+
+    return {"min_ms": min(times), "median_ms": statistics.median(times)}
+
+
+def run(counts: list[int], repeat: int, tmp: Path) -> dict[str, dict[str, float]]:
+    from fakes import install_gpg, install_toolchain
+
+    install_toolchain(tmp.joinpath("bin"))
+    install_gpg()
+
+    results: dict[str, dict[str, float]] = {}
+    for count in counts:
+        results.update(run_count(count, repeat, tmp))
+
+    return results
+
+
+def run_count(count: int, repeat: int, tmp: Path) -> dict[str, dict[str, float]]:
+    from fakes import install_devices
+
+    from yubigen import core, inventory, keygen, pgp, ssh
+
+    install_devices(count, tmp.joinpath(f"dev{count}"))
+    core.device_cache.invalidate()
+
+    fido = ssh.MODULE.connection
+    homedir = pgp.gen_homedir_path()
+    homedir.mkdir(0o700, parents=True, exist_ok=True)
+
+    results: dict[str, dict[str, float]] = {}
+
+    results[f"enumerate_cold[{count}]"] = measure(lambda: core.list_devices(fido, quiet=True), repeat, core.device_cache.invalidate)
+    results[f"enumerate_warm[{count}]"] = measure(lambda: core.list_devices(fido, quiet=True), repeat)
+    results[f"iter_devices[{count}]"] = measure(lambda: list(ssh.MODULE.iter_devices(quiet=True)), repeat)
+
+    devices = list(ssh.MODULE.iter_devices(quiet=True))
+
+    def download() -> None:
+        for device, info in devices:
+            ssh.download_keys(device, info)
+
+    def write_config() -> None:
+        with ssh.ConfigBatch({"Work": ("github.com", "gitlab.com")}) as batch:
+            for _, info in devices:
+                batch.add(info.serial or 0)
+
+    results[f"download_keys[{count}]"] = measure(download, repeat)
+    results[f"write_config[{count}]"] = measure(write_config, repeat)
+
+    def lookup() -> None:
+        with inventory.open_inventory() as db:
+            _ = inventory.find_ssh_keys(db, host="github.com")
+            _ = inventory.find_pgp_keys(db, f"{0:040X}")
+
+    results[f"inventory_lookup[{count}]"] = measure(lookup, repeat)
+    results[f"export_keys[{count}]"] = measure(lambda: pgp.export_keys([f"{index:040X}" for index in range(count)], homedir), repeat)
+    results[f"transfer_key_batch[{count}]"] = measure(lambda: pgp.transfer_key_batch(f"{0:040X}"), repeat)
+
+    manifest = keygen.KeyManifest.model_validate({
+        "keys": [
+            {
+                "uids": [f"User {index} <user{index}@example.com>", f"<user{index}@example.org>"],
+                **({"passphrase": "benchmark"} if index % 2 else {}),
+            }
+            for index in range(count)
+        ]
+    })
+
+    def generate() -> None:
+        failed = [result for _, result in keygen.generate_keys(manifest, jobs=4) if isinstance(result, Exception)]
+        if failed:
+            raise RuntimeError(f"Key generation failed: {failed[0]}")
+
+    results[f"generate_keys[{count}]"] = measure(generate, repeat)
+
+    return results
+
+
+def compare(
+    history: list[dict[str, object]],
+    revision: str,
+    results: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[str]:
+    previous = next((entry for entry in reversed(history) if entry.get("revision") != revision), None)
+
+    regressions: list[str] = []
+    for name, result in results.items():
+        line = f"{name:28} min {result['min_ms']:9.2f} ms  median {result['median_ms']:9.2f} ms"
+
+        baseline = None if previous is None else previous["results"].get(name)  # pyright: ignore[reportAttributeAccessIssue, reportUnknownMemberType]
+        if baseline is not None:
+            change = result["median_ms"] / max(baseline["median_ms"], 1e-6) - 1  # pyright: ignore[reportUnknownArgumentType]
+            line += f"  {change:+7.1%} vs {previous['revision']}"  # pyright: ignore[reportOptionalSubscript]
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark yubigen against simulated devices and toolchain")
+    _ = parser.add_argument("--devices", default="1,10,100", help="Comma separated device counts")
+    _ = parser.add_argument("--repeat", type=int, default=5)
+    _ = parser.add_argument("--history", type=Path, default=ROOT.joinpath(".benchmarks", "history.jsonl"))
+    _ = parser.add_argument("--threshold", type=float, default=0.2, help="Relative median slowdown reported as a regression")
+    _ = parser.add_argument("--fail-on-regression", action="store_true")
+    _ = parser.add_argument("--no-record", action="store_true", help="Do not append results to the history file")
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.devices.split(",")]  # pyright: ignore[reportAny]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["XDG_CONFIG_HOME", "XDG_DATA_HOME", "XDG_STATE_HOME", "XDG_CACHE_HOME", "XDG_RUNTIME_DIR"]:
+            path = Path(tmp).joinpath(name.lower())
+            path.mkdir(0o700)
+            os.environ[name] = str(path)
+        os.environ["GNUPGHOME"] = str(Path(tmp).joinpath("gnupg"))
+
+        sys.path[:0] = [str(ROOT.joinpath("src")), str(Path(__file__).parent)]
+        results = run(counts, args.repeat, Path(tmp))  # pyright: ignore[reportAny]
+
+    history_path: Path = args.history  # pyright: ignore[reportAny]
+    history: list[dict[str, object]] = []
+    if history_path.exists():
+        history = [json.loads(line) for line in history_path.read_text().splitlines() if line.strip()]  # pyright: ignore[reportAny]
+
+    revision = git_revision()
+    regressions = compare(history, revision, results, args.threshold)  # pyright: ignore[reportAny]
+
+    if not args.no_record:  # pyright: ignore[reportAny]
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path, "a") as file:
+            entry = {
+                "revision": revision,
+                "time": datetime.now(timezone.utc).isoformat(),
+                "python": sys.version.split()[0],
+                "results": results,
+            }
+            _ = file.write(json.dumps(entry) + "\n")
+
+    if regressions and args.fail_on_regression:  # pyright: ignore[reportAny]
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
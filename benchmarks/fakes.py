@@ -0,0 +1,199 @@
+import hashlib
+import io
+import os
+import stat
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, override
+
+SSH_KEYGEN = """#!/bin/sh
+if [ "$1" = "-K" ]; then
+    for application in github.com gitlab.com Work; do
+        printf 'private %s\\n' "$application" > "id_ed25519_sk_rk_$application"
+        printf 'public %s\\n' "$application" > "id_ed25519_sk_rk_$application.pub"
+    done
+    exit 0
+fi
+while [ "$#" -gt 0 ]; do
+    if [ "$1" = "-f" ]; then
+        printf 'private\\n' > "$2"
+        printf 'public\\n' > "$2.pub"
+    fi
+    shift
+done
+"""
+TOOLS = {
+    "ssh-keygen": SSH_KEYGEN,
+    "gpg": "#!/bin/sh\nexit 0\n",
+    "gpgconf": "#!/bin/sh\nexit 0\n",
+    "pamu2fcfg": "#!/bin/sh\nprintf ':%s,%s,es256,+presence\\n' khandle pubkey\n",
+}
+PINENTRY_MODE_LOOPBACK = 4
+
+
+def install_toolchain(dir: Path) -> None:
+    dir.mkdir(parents=True, exist_ok=True)
+    for name, script in TOOLS.items():
+        path = dir.joinpath(name)
+        _ = path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+    os.environ["PATH"] = f"{dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+class FakeSubkey:
+    def __init__(self, fingerprint: str, can_sign: int = 0, can_encrypt: int = 0, can_authenticate: int = 0) -> None:
+        self.fpr: str = fingerprint
+        self.can_sign: int = can_sign
+        self.can_encrypt: int = can_encrypt
+        self.can_authenticate: int = can_authenticate
+
+
+class FakeKey:
+    def __init__(self, fingerprint: str) -> None:
+        self.fpr: str = fingerprint
+        self.subkeys: list[FakeSubkey] = [
+            FakeSubkey(fingerprint, can_sign=1),
+            FakeSubkey(f"{fingerprint[:-1]}E", can_encrypt=1),
+            FakeSubkey(f"{fingerprint[:-1]}A", can_authenticate=1),
+        ]
+
+
+class FakeData(io.BytesIO):
+    pass
+
+
+class FakeContext:
+    def __init__(self, **kwargs: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        self.kwargs: dict[str, Any] = kwargs  # pyright: ignore[reportExplicitAny]
+        self.pinentry_mode: int = 0
+        self.passphrase_cb: Callable[..., str] | None = None
+
+    def __enter__(self) -> "FakeContext":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def get_key(self, fingerprint: str, secret: bool = False) -> FakeKey:
+        return FakeKey(fingerprint)
+
+    def op_export(self, pattern: str, mode: int, sink: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        data = f"-----BEGIN PGP BLOCK-----\n{pattern} {mode}\n-----END PGP BLOCK-----\n".encode()
+        if isinstance(sink, FakeData):
+            _ = sink.write(data)
+        else:
+            _ = os.write(sink.fileno(), data)  # pyright: ignore[reportAny]
+
+    def encrypt(self, plaintext: Any, recipients: Any, sign: bool, sink: Any, passphrase: str | None = None) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        while chunk := plaintext.read(1 << 16):  # pyright: ignore[reportAny]
+            sink.write(chunk)  # pyright: ignore[reportAny]
+
+    def unlock(self) -> None:
+        if self.pinentry_mode != PINENTRY_MODE_LOOPBACK or self.passphrase_cb is None:
+            raise RuntimeError("gpg-agent would block on pinentry")
+        _ = self.passphrase_cb(None, "", False)
+
+    def create_key(self, userid: str, **kwargs: Any) -> SimpleNamespace:  # pyright: ignore[reportAny, reportExplicitAny]
+        self.unlock()
+        fingerprint = hashlib.sha1(f"{self.kwargs.get('home_dir')}{userid}".encode()).hexdigest().upper()
+        home = Path(os.fsdecode(self.kwargs["home_dir"]))  # pyright: ignore[reportAny]
+        home.joinpath("private-keys-v1.d").mkdir(0o700, exist_ok=True)
+        home.joinpath("private-keys-v1.d", f"{fingerprint}.key").write_text(userid)
+        return SimpleNamespace(fpr=fingerprint)
+
+    def create_subkey(self, key: FakeKey, **kwargs: Any) -> SimpleNamespace:  # pyright: ignore[reportAny, reportExplicitAny]
+        self.unlock()
+        return SimpleNamespace(fpr=f"{key.fpr[:-1]}S")
+
+    def set_passphrase_cb(self, callback: Callable[..., str]) -> None:
+        self.passphrase_cb = callback
+
+    def key_add_uid(self, key: FakeKey, uid: str) -> None:
+        self.unlock()
+
+    def op_import(self, data: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        pass
+
+    def keylist(self, secret: bool = False) -> list[FakeKey]:
+        home = Path(os.fsdecode(self.kwargs["home_dir"]))  # pyright: ignore[reportAny]
+        return [FakeKey(path.stem) for path in home.glob("private-keys-v1.d/*.key")]
+
+    def interact(self, key: FakeKey, callback: Callable[[str, str], str | None]) -> None:
+        while True:
+            answer = callback("GET_LINE", "keyedit.prompt")
+            if answer == "quit":
+                break
+            if answer == "keytocard":
+                _ = callback("GET_LINE", "cardedit.genkeys.storekeytype")
+
+
+def install_gpg() -> None:
+    gpg = ModuleType("gpg")
+    errors = ModuleType("gpg.errors")
+
+    class GPGMEError(Exception):
+        pass
+
+    class KeyNotFound(GPGMEError, KeyError):
+        pass
+
+    errors.GPGMEError = GPGMEError  # pyright: ignore[reportAttributeAccessIssue]
+    errors.KeyNotFound = KeyNotFound  # pyright: ignore[reportAttributeAccessIssue]
+    gpg.errors = errors  # pyright: ignore[reportAttributeAccessIssue]
+    gpg.Context = FakeContext  # pyright: ignore[reportAttributeAccessIssue]
+    gpg.Data = FakeData  # pyright: ignore[reportAttributeAccessIssue]
+    gpg.constants = SimpleNamespace(EXPORT_MODE_SECRET=16, EXPORT_MODE_SECRET_SUBKEY=32, PINENTRY_MODE_LOOPBACK=PINENTRY_MODE_LOOPBACK)  # pyright: ignore[reportAttributeAccessIssue]
+
+    sys.modules["gpg"] = gpg
+    sys.modules["gpg.errors"] = errors
+
+
+def install_devices(count: int, dir: Path) -> None:
+    import ykman.device
+    import yubikit.support
+    from ykman.base import YkmanDevice
+    from yubikit.core import PID, TRANSPORT, Version
+    from yubikit.management import CAPABILITY, FORM_FACTOR, DeviceConfig, DeviceInfo
+
+    dir.mkdir(parents=True, exist_ok=True)
+    capabilities = {TRANSPORT.USB: CAPABILITY.FIDO2 | CAPABILITY.OPENPGP}
+
+    class FakeDevice(YkmanDevice):
+        def __init__(self, fingerprint: str, serial: int) -> None:
+            super().__init__(TRANSPORT.USB, fingerprint, PID.YK4_OTP_FIDO_CCID)
+            self.serial: int = serial
+
+        @override
+        def supports_connection(self, connection_type: type) -> bool:
+            return True
+
+        @override
+        def open_connection(self, connection_type: type) -> Any:  # pyright: ignore[reportIncompatibleMethodOverride, reportExplicitAny]
+            return nullcontext(self)
+
+    def list_ctap_devices() -> list[FakeDevice]:
+        return [FakeDevice(str(dir.joinpath(f"hidraw{index}")), 10000000 + index) for index in range(count)]
+
+    def list_ccid_devices() -> list[FakeDevice]:
+        return [FakeDevice(f"Yubico YubiKey OTP+FIDO+CCID {index:02}", 10000000 + index) for index in range(count)]
+
+    def read_info(conn: FakeDevice, pid: PID | None = None) -> DeviceInfo:
+        return DeviceInfo(
+            config=DeviceConfig(dict(capabilities)),
+            serial=conn.serial,
+            version=Version(5, 7, 2),
+            form_factor=FORM_FACTOR.USB_A_KEYCHAIN,
+            supported_capabilities=dict(capabilities),
+            is_locked=False,
+        )
+
+    for index in range(count):
+        dir.joinpath(f"hidraw{index}").touch()
+
+    ykman.device.list_ctap_devices = list_ctap_devices  # pyright: ignore[reportAttributeAccessIssue]
+    ykman.device.list_ccid_devices = list_ccid_devices  # pyright: ignore[reportAttributeAccessIssue]
+    ykman.device.list_otp_devices = lambda: []  # pyright: ignore[reportAttributeAccessIssue]
+    yubikit.support.read_info = read_info  # pyright: ignore[reportAttributeAccessIssue]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HEAVY_MODULES = ["fido2.ctap2", "gpg", "pydantic", "ykman.device", "yubikit.management", "yubikit.support"]
+SCENARIOS: dict[str, list[str] | None] = {
+    "import": None,
+    "help": ["--help"],
+    "ssh-help": ["ssh", "--help"],
+    "ssh-unregister": ["ssh", "unregister", "benchmark"],
+}
+
+CHILD = """
+import sys, json
+from yubigen.main import main
+args = json.loads(sys.argv[1])
+if args is not None:
+    try:
+        main(args, standalone_mode=False)
+    except SystemExit:
+        pass
+heavy = json.loads(sys.argv[2])
+print(json.dumps(sorted(name for name in heavy if name in sys.modules)), file=sys.stderr)
+"""
+
+
+def run(args: list[str] | None, env: dict[str, str]) -> tuple[float, list[str]]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(args), json.dumps(HEAVY_MODULES)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+
+    return elapsed, json.loads(result.stderr.strip().splitlines()[-1])  # pyright: ignore[reportAny]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure yubigen cold-start latency")
+    _ = parser.add_argument("--runs", type=int, default=10)
+    _ = parser.add_argument("--budget-ms", type=float, default=None, help="Fail if any scenario median exceeds this")
+    _ = parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(Path(__file__).parents[1].joinpath("src")), env.get("PYTHONPATH")]))
+        for name in ["XDG_CONFIG_HOME", "XDG_DATA_HOME", "XDG_STATE_HOME", "XDG_CACHE_HOME"]:
+            env[name] = str(Path(tmp).joinpath(name.lower()))
+
+        results: dict[str, dict[str, float | list[str]]] = {}
+        failed = False
+        for scenario, scenario_args in SCENARIOS.items():
+            times: list[float] = []
+            loaded: set[str] = set()
+            for _ in range(args.runs):  # pyright: ignore[reportAny]
+                elapsed, heavy = run(scenario_args, env)
+                times.append(elapsed)
+                loaded.update(heavy)
+
+            median = statistics.median(times)
+            results[scenario] = {"min_ms": min(times), "median_ms": median, "heavy_modules": sorted(loaded)}
+
+            if len(loaded) > 0 or (args.budget_ms is not None and median > args.budget_ms):  # pyright: ignore[reportAny]
+                failed = True
+
+    if args.json:  # pyright: ignore[reportAny]
+        print(json.dumps(results, indent=2))
+    else:
+        for scenario, result in results.items():
+            print(f"{scenario:16} min {result['min_ms']:8.1f} ms  median {result['median_ms']:8.1f} ms", end="")
+            print(f"  heavy: {', '.join(result['heavy_modules'])}" if result["heavy_modules"] else "")  # pyright: ignore[reportArgumentType]
+
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ in
   options.programs.yubigen = {
     enable = lib.mkEnableOption "yubigen";
     enableSshIntegration = lib.mkEnableOption "yubigen OpenSSH integration";
+    enableDaemon = lib.mkEnableOption "yubigen background daemon";
     package = lib.mkPackageOption self.packages.${pkgs.system} "yubigen" { };
 
     settings = lib.mkOption {
@@ -63,6 +64,19 @@ in
           };
         };
       })
+
+      (lib.mkIf cfg.enableDaemon {
+        systemd.user.services.yubigen = {
+          Unit.Description = "yubigen daemon";
+
+          Service = {
+            ExecStart = "${lib.getExe cfg.package} daemon run";
+            Restart = "on-failure";
+          };
+
+          Install.WantedBy = [ "default.target" ];
+        };
+      })
     ]
   );
 }
@@ -2,5 +2,4 @@
 
 from yubigen.main import main
 
-
 main()
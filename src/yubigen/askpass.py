@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import socket
+import sys
+from collections.abc import Mapping
+from pathlib import Path
+from threading import Thread
+from types import TracebackType
+from typing import Self
+
+from click.exceptions import Abort
+
+from yubigen.core import programdirs, prompt_queue
+from yubigen.trace import span
+
+
+class AskpassServer:
+    def __init__(self) -> None:
+        self.dir: Path = programdirs.user_runtime_path.joinpath(f"askpass-{os.getpid()}")
+        self.socket: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.thread: Thread = Thread(target=self.run, name="yubigen-askpass", daemon=True)
+
+    @property
+    def socket_path(self) -> Path:
+        return self.dir.joinpath("socket")
+
+    @property
+    def script_path(self) -> Path:
+        return self.dir.joinpath("askpass")
+
+    def env(self, serial: int | None = None) -> Mapping[str, str]:
+        env = dict(os.environ)
+        env["SSH_ASKPASS"] = str(self.script_path)
+        env["SSH_ASKPASS_REQUIRE"] = "force"
+        env["YUBIGEN_ASKPASS_SOCKET"] = str(self.socket_path)
+        if serial is not None:
+            env["YUBIGEN_SERIAL"] = str(serial)
+
+        return env
+
+    def run(self) -> None:
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except OSError:
+                return
+
+            Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn: socket.socket) -> None:
+        with conn, conn.makefile("rw") as file:
+            request = json.loads(file.readline())  # pyright: ignore[reportAny]
+            text = f"[SN {request['serial']}] {request['prompt']}" if request.get("serial") else str(request["prompt"])  # pyright: ignore[reportAny]
+
+            if request.get("kind") == "none":  # pyright: ignore[reportAny]
+                prompt_queue.notify(text)
+                with span("touch", int(request["serial"]) if request.get("serial") else None, "human"):  # pyright: ignore[reportAny]
+                    _ = file.read()
+                return
+
+            try:
+                answer = prompt_queue.prompt(text, request.get("kind") != "confirm")  # pyright: ignore[reportAny]
+            except Abort:
+                return
+
+            _ = file.write(json.dumps({"answer": answer}) + "\n")
+
+    def __enter__(self) -> Self:
+        for parent in reversed(self.dir.parents):
+            parent.mkdir(0o700, exist_ok=True)
+        self.dir.mkdir(0o700, exist_ok=True)
+
+        with open(self.script_path, "w") as file:
+            _ = file.write(f"#!{sys.executable}\nimport sys\nsys.path[:0] = {sys.path!r}\nfrom yubigen.askpass import main\nmain()\n")
+        self.script_path.chmod(0o700)
+
+        self.socket_path.unlink(missing_ok=True)
+        self.socket.bind(str(self.socket_path))
+        self.socket.listen()
+        self.thread.start()
+
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.socket.close()
+        self.socket_path.unlink(missing_ok=True)
+        self.script_path.unlink(missing_ok=True)
+        self.dir.rmdir()
+
+
+def main() -> None:
+    request = {
+        "prompt": sys.argv[1] if len(sys.argv) > 1 else "",
+        "kind": os.environ.get("SSH_ASKPASS_PROMPT", ""),
+        "serial": os.environ.get("YUBIGEN_SERIAL"),
+    }
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(os.environ["YUBIGEN_ASKPASS_SOCKET"])
+        with conn.makefile("rw") as file:
+            _ = file.write(json.dumps(request) + "\n")
+            file.flush()
+
+            if request["kind"] == "none":
+                _ = signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+                _ = file.readline()
+                return
+
+            response = file.readline()
+
+    if len(response) < 1:
+        exit(1)
+
+    print(json.loads(response)["answer"])  # pyright: ignore[reportAny]
+
+
+if __name__ == "__main__":
+    main()
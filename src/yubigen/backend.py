@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from yubigen.hotplug import device_stamp, usb_serial
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.core import Connection
+    from yubikit.management import DeviceInfo
+
+
+class Backend:
+    name: str = "usb"
+
+    def list_devices(self, kind: str) -> list[YkmanDevice]:
+        from ykman.device import list_ccid_devices, list_ctap_devices, list_otp_devices
+
+        if kind == "ccid":
+            return list(list_ccid_devices())
+        if kind == "otp":
+            return list(list_otp_devices())
+
+        return list(list_ctap_devices())
+
+    def read_info(self, device: YkmanDevice, connection: type[Connection]) -> DeviceInfo:
+        from yubikit.support import read_info
+
+        with device.open_connection(connection) as conn:
+            return read_info(conn, device.pid)
+
+    def stamp(self, kind: str, fingerprint: str) -> object:
+        if kind == "ccid":
+            return None
+
+        return device_stamp(fingerprint)
+
+    def serial_hint(self, kind: str, fingerprint: str) -> int | None:
+        return usb_serial(fingerprint) if kind == "ctap" else None
+
+
+def device_errors() -> tuple[type[Exception], ...]:
+    from fido2.ctap import CtapError
+    from smartcard.Exceptions import SmartcardException
+    from smartcard.pcsc.PCSCExceptions import BaseSCardException
+    from yubikit.core import CommandError
+
+    return (OSError, ValueError, CommandError, CtapError, SmartcardException, BaseSCardException)
+
+
+def load_backend(spec: str) -> Backend:
+    name, _, argument = spec.partition(":")
+    if name == "usb" and argument == "":
+        return Backend()
+    if name == "sim":
+        from yubigen.sim import SimBackend
+
+        return SimBackend.from_spec(argument)
+
+    raise ValueError(f"Unknown backend '{spec}', expected usb or sim:COUNT")
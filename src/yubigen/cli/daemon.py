@@ -0,0 +1,56 @@
+import asyncio
+
+import click
+from click.termui import secho
+from click.utils import echo
+
+from yubigen.daemon import Daemon, request, socket_path
+
+
+@click.group(help="Background service tracking inserted YubiKeys")
+def daemon():
+    pass
+
+
+@daemon.command(help="Run the daemon in the foreground")
+def run():
+    from yubigen import config
+
+    try:
+        asyncio.run(Daemon(config.read().daemon).serve())
+    except RuntimeError as e:
+        secho(str(e), err=True, fg="red")
+        exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+@daemon.command(help="Show whether the daemon is running")
+def status():
+    result = request("ping")
+    if result is None:
+        secho("Daemon is not running.", err=True, fg="red")
+        exit(1)
+
+    echo(f"Daemon running as PID {result['pid']} on {socket_path()}")  # pyright: ignore[reportAny]
+    for serial in result["devices"]:  # pyright: ignore[reportAny]
+        echo(f"  SN {serial}")
+
+
+@daemon.command(help="Make the daemon enumerate devices again")
+def refresh():
+    result = request("refresh", timeout=30)
+    if result is None:
+        secho("Daemon is not running.", err=True, fg="red")
+        exit(1)
+
+    echo(f"Tracking {len(result)} device{'' if len(result) == 1 else 's'}.")  # pyright: ignore[reportAny]
+
+
+@daemon.command(help="Stop the daemon")
+def stop():
+    if request("stop") is None:
+        secho("Daemon is not running.", err=True, fg="red")
+        exit(1)
+
+    secho("\nComplete!", fg="magenta")
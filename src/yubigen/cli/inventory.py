@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import click
+from click.termui import secho
+from click.utils import echo
+
+from yubigen.inventory import find_devices, find_pgp_keys, find_ssh_keys, open_inventory, record_registration
+
+
+def format_time(timestamp: float | None) -> str:
+    return "-" if timestamp is None else datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+@click.group(help="Query the local device and key inventory")
+def inventory():
+    pass
+
+
+@inventory.command(help="List known YubiKeys")
+@click.option("--serial", type=int, help="Only show this serial number")
+def devices(serial: int | None):
+    with open_inventory() as db:
+        rows = find_devices(db, serial)
+
+    for row in rows:
+        secho(f"SN {row['serial']}", fg="green", nl=False)
+        echo(f"  {row['version'] or '-'}  {row['form_factor'] or '-'}  seen {format_time(row['seen_at'])}", nl=False)
+        echo(f"  registered as {row['names']}" if row["names"] else "")
+
+
+@inventory.command(help="Find YubiKeys holding OpenSSH credentials")
+@click.option("--host", type=str, help="Host the key is configured for")
+@click.option("--application", type=str, help="Application name the key was created for")
+@click.option("--fingerprint", type=str, help="SHA256 fingerprint of the public key")
+@click.option("--serial", type=int, help="Only show this serial number")
+def ssh(host: str | None, application: str | None, fingerprint: str | None, serial: int | None):
+    with open_inventory() as db:
+        rows = find_ssh_keys(db, host, application, fingerprint, serial)
+
+    for row in rows:
+        secho(f"SN {row['serial']}", fg="green", nl=False)
+        echo(f"  {row['file']}  {row['fingerprint'] or '-'}  hosts: {row['hosts'] or '-'}")
+
+
+@inventory.command(help="Find YubiKeys holding OpenPGP keys")
+@click.argument("fingerprint", type=str, required=False)
+@click.option("--serial", type=int, help="Only show this serial number")
+def pgp(fingerprint: str | None, serial: int | None):
+    from yubigen.cli.pgp import SLOT_NAMES
+
+    with open_inventory() as db:
+        rows = find_pgp_keys(db, fingerprint, serial)
+
+    for row in rows:
+        secho(f"SN {row['serial']}", fg="green", nl=False)
+        echo(f"  {SLOT_NAMES.get(row['slot'], row['slot']):14}  {row['subkey'] or row['fingerprint']}", nl=False)
+        echo(f"  of {row['fingerprint']}  transferred {format_time(row['transferred_at'])}")
+
+
+@inventory.command(help="Rebuild OpenSSH entries from downloaded keys and registrations")
+def rebuild():
+    from yubigen import config
+    from yubigen.ssh import MODULE, update_inventory
+
+    cfg = config.read()
+
+    echo("Rebuilding inventory...")
+
+    serials = [int(path.name) for path in MODULE.data_home.iterdir() if path.name.isdigit()] if MODULE.data_home.exists() else []
+    with open_inventory() as db, db:
+        for serial in serials:
+            update_inventory(db, serial, cfg.ssh.applications, cfg.ssh.explicit_applications)
+
+        for path in MODULE.state_home.glob("config_*") if MODULE.state_home.exists() else []:
+            if path.is_symlink() and path.readlink().parent.name.isdigit():
+                record_registration(db, path.name.removeprefix("config_"), int(path.readlink().parent.name))
+
+    echo(f"Indexed {len(serials)} device(s).")
+
+    secho("\nComplete!", fg="magenta")
@@ -0,0 +1,34 @@
+from collections.abc import Mapping
+from importlib import import_module
+from typing import Any, cast, override
+
+import click
+
+
+class LazyGroup(click.Group):
+    def __init__(
+        self,
+        *args: Any,  # pyright: ignore[reportAny, reportExplicitAny]
+        lazy_subcommands: Mapping[str, str] | None = None,
+        **kwargs: Any,  # pyright: ignore[reportAny, reportExplicitAny]
+    ) -> None:
+        super().__init__(*args, **kwargs)  # pyright: ignore[reportAny]
+        self.lazy_subcommands: dict[str, str] = {} if lazy_subcommands is None else dict(lazy_subcommands)
+
+    @override
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    @override
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name in self.lazy_subcommands:
+            return self.load_command(cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+    def load_command(self, cmd_name: str) -> click.Command:
+        module_name, _, attribute = self.lazy_subcommands.pop(cmd_name).partition(":")
+        command = cast(click.Command, getattr(import_module(module_name), attribute))
+        self.add_command(command, cmd_name)
+
+        return command
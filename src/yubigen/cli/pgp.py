@@ -1,8 +1,46 @@
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import click
 from click.termui import confirm, secho
 from click.utils import echo
 
-from yubigen.pgp import create_key, export_key, gen_homedir_path, purge_keys, transfer_key
+from yubigen.events import emitter
+from yubigen.pgp import (
+    create_key,
+    export_archive,
+    export_key,
+    export_keys,
+    gen_homedir_path,
+    purge_keys,
+    transfer_key,
+    transfer_key_batch,
+)
+
+if TYPE_CHECKING:
+    from yubikit.management import DeviceInfo
+
+
+SLOT_NAMES = {"1": "signature", "2": "encryption", "3": "authentication"}
+
+
+def display_transfer_results(results: list[tuple[DeviceInfo, dict[str, bool] | Exception]]) -> None:
+    echo("\nSummary:")
+    for info, result in results:
+        echo(f"  SN {info.serial}: ", nl=False)
+        if isinstance(result, Exception):
+            secho(f"failed ({type(result).__name__}: {result})", fg="red")
+            continue
+
+        for index, (slot, success) in enumerate(sorted(result.items())):
+            echo(", " if index > 0 else "", nl=False)
+            secho(f"{SLOT_NAMES.get(slot, slot)} {'ok' if success else 'failed'}", nl=False, fg="green" if success else "red")
+        echo("" if len(result) > 0 else "nothing transferred")
 
 
 @click.group(help="OpenPGP key management")
@@ -51,12 +89,42 @@ This will delete the generated GPG home at {gen_homedir_path()}.""",
     secho("\nComplete!", fg="magenta")
 
 
-@pgp.command(help="Export OpenPGP key")
-@click.argument("key", type=str)
-def export(key: str):
+@pgp.command(help="Generate OpenPGP keys unattended from a manifest")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of keys to generate in parallel")
+def generate(manifest: Path, jobs: int):
+    from pydantic import ValidationError
+
+    from yubigen.keygen import generate_keys, read_key_manifest
+
+    try:
+        key_manifest = read_key_manifest(manifest)
+    except (OSError, ValueError, ValidationError) as e:
+        secho(f"Could not read key manifest: {e}", err=True, fg="red")
+        exit(1)
+
+    secho(f"Keys will be collected in the GNUPG home at {gen_homedir_path()}.", err=True, fg="yellow")
+
+    results = generate_keys(key_manifest, jobs)
+    if not emitter.enabled:
+        echo("\nSummary:")
+        for spec, result in results:
+            echo(f"  {spec.name or spec.uids[0]}: ", nl=False)
+            if isinstance(result, Exception):
+                secho(f"failed ({type(result).__name__}: {result})", fg="red")
+            else:
+                secho(result, fg="green")
+
+    if any(isinstance(result, Exception) for _, result in results):
+        exit(1)
+
+
+@pgp.command(help="Export OpenPGP keys")
+@click.argument("keys", type=str, nargs=-1, required=True)
+def export(keys: tuple[str, ...]):
     echo("Starting key export process...")
 
-    export_key(key)
+    _ = export_keys(keys)
 
     if confirm("\nPurge created GNUPG home now?"):
         _ = confirm(
@@ -72,12 +140,70 @@ This will delete the generated GPG home at {gen_homedir_path()}.""",
     secho("\nComplete!", fg="magenta")
 
 
+@pgp.command(help="Write OpenPGP keys into one symmetrically encrypted archive")
+@click.argument("keys", type=str, nargs=-1, required=True)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, allow_dash=True, path_type=Path),
+    required=True,
+    help="Archive path or - for stdout",
+)
+@click.option("--armor", "-a", is_flag=True, help="ASCII armor the archive")
+@click.option("--passphrase-fd", type=click.IntRange(0), help="Read the archive passphrase from this file descriptor")
+def backup(keys: tuple[str, ...], output: Path, armor: bool, passphrase_fd: int | None):
+    from yubigen.setup import prompt_pin
+
+    if str(output) == "-" and emitter.enabled:
+        secho("Cannot write the archive to stdout while it carries JSON events, use --output PATH.", err=True, fg="red")
+        exit(1)
+    if str(output) == "-" and not armor and sys.stdout.isatty():
+        secho("Refusing to write a binary archive to a terminal, use --armor or --output.", err=True, fg="red")
+        exit(1)
+
+    if passphrase_fd is not None:
+        with os.fdopen(passphrase_fd) as file:
+            passphrase = file.readline().rstrip("\n")
+    else:
+        passphrase = prompt_pin("Archive passphrase", confirmation_prompt=True)
+
+    echo("Starting key backup process...", err=True)
+
+    if str(output) == "-":
+        export_archive(keys, sys.stdout.buffer, passphrase, armor)
+        sys.stdout.buffer.flush()
+    else:
+        path = output.with_name(f"{output.name}.new")
+        try:
+            with open(path, "wb", opener=lambda file, flags: os.open(file, flags, 0o600)) as file:
+                export_archive(keys, file, passphrase, armor)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        _ = shutil.move(path, output)
+
+        echo(f"Keys backed up to {str(output)}", err=True)
+
+    secho("\nComplete!", fg="magenta", err=True)
+
+
 @pgp.command(help="Transfer OpenPGP key to YubiKeys")
 @click.argument("key", type=str)
-def transfer(key: str):
+@click.option("--all", "all_devices", is_flag=True, help="Transfer to every inserted OpenPGP-capable YubiKey in turn")
+def transfer(key: str, all_devices: bool):
     echo("Starting key transfer process...")
 
-    transfer_key(key)
+    failed = False
+    if all_devices:
+        results = transfer_key_batch(key)
+        display_transfer_results(results)
+        failed = any(isinstance(result, Exception) or not result or not all(result.values()) for _, result in results)
+    else:
+        transfer_key(key)
+
+    if failed:
+        secho("\nSome transfers failed, keeping the created GNUPG home to retry.", fg="red")
+        exit(1)
 
     if confirm("\nPurge created GNUPG home now?"):
         _ = confirm(
@@ -1,14 +1,97 @@
-from typing import cast
+from __future__ import annotations
+
+import json
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar, cast
 
 import click
 from click.termui import secho
-from yubikit.core import Connection
-from yubikit.core.fido import FidoConnection
-from yubikit.core.smartcard import SmartCardConnection
-from yubikit.openpgp import OpenPgpSession
+from click.utils import echo
+
+from yubigen.core import iter_devices, run_devices, session_pool
+from yubigen.events import emit, emitter
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.core import Connection
+    from yubikit.core.fido import FidoConnection
+    from yubikit.management import DeviceInfo
+
+    from yubigen.pins import PinSource
+
+
+F = TypeVar("F", bound=Callable[..., Any])  # pyright: ignore[reportExplicitAny]
+
+
+def pin_source_options(fn: F) -> F:
+    fn = click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of devices to operate on in parallel")(fn)
+    fn = click.option(
+        "--pins-command",
+        type=str,
+        envvar="YUBIGEN_PIN_COMMAND",
+        help="Command printing the PIN named by $YUBIGEN_PIN for $YUBIGEN_SERIAL",
+    )(fn)
+    fn = click.option(
+        "--pins-file",
+        type=click.Path(exists=True, dir_okay=False, path_type=Path),
+        help="JSON or TOML manifest of PINs by serial",
+    )(fn)
+    fn = click.option("--pins-fd", type=click.IntRange(0), help="Read a JSON or TOML PIN manifest from this file descriptor")(fn)
+    return fn
+
+
+def read_pin_source(pins_fd: int | None, pins_file: Path | None, pins_command: str | None) -> PinSource | None:
+    from pydantic import ValidationError
+
+    from yubigen.pins import PinSource, read_manifest_fd, read_manifest_file
+
+    if pins_fd is None and pins_file is None and pins_command is None:
+        return None
+
+    try:
+        manifest = read_manifest_fd(pins_fd) if pins_fd is not None else None if pins_file is None else read_manifest_file(pins_file)
+    except (OSError, ValueError, ValidationError) as e:
+        secho(f"Could not read PIN manifest: {e}", err=True, fg="red")
+        exit(1)
 
-from yubigen.core import iter_devices
-from yubigen.setup import change_fido_pin, change_openpgp_admin_pin, change_openpgp_pin
+    return PinSource(manifest, pins_command)
+
+
+def run_batch(
+    application: str,
+    connection: type[Connection | FidoConnection],
+    factory: Callable[[Any], Any],  # pyright: ignore[reportExplicitAny]
+    apply: Callable[[Any, int, PinSource], list[str]],  # pyright: ignore[reportExplicitAny]
+    source: PinSource,
+    jobs: int,
+) -> None:
+    changes: dict[int, list[str]] = {}
+
+    def job(device: YkmanDevice, info: DeviceInfo) -> None:
+        assert info.serial is not None
+
+        with session_pool.session(device, info, connection, factory) as session:
+            changes[info.serial] = apply(session, info.serial, source)
+
+    results = run_devices(job, iter_devices(connection, abort=True, quiet=True), jobs=jobs)
+
+    for info, error in results:
+        changed = changes.get(cast(int, info.serial), [])
+        result: dict[str, object] = {
+            "application": application,
+            "status": "error" if error is not None else "ok" if len(changed) > 0 else "skipped",
+            "changed": changed,
+        }
+        if error is not None:
+            result["error"] = f"{type(error).__name__}: {error}"
+        if emitter.enabled:
+            emit("pins_changed", info.serial, **result)
+        else:
+            echo(json.dumps({"serial": info.serial, **result}))
+
+    if any(error is not None for _, error in results):
+        exit(1)
 
 
 @click.group(help="YubiKey setup helpers")
@@ -17,20 +100,40 @@ def setup():
 
 
 @setup.command(help="Setup FIDO PIN")
-def fido():
-    for device, _ in iter_devices(FidoConnection):
-        with cast(FidoConnection, device.open_connection(cast(type[Connection], FidoConnection))) as conn:  # pyright: ignore[reportInvalidCast]
-            change_fido_pin(conn)
+@pin_source_options
+def fido(pins_fd: int | None, pins_file: Path | None, pins_command: str | None, jobs: int):
+    from fido2.ctap2.base import Ctap2
+    from yubikit.core.fido import FidoConnection
+
+    from yubigen.setup import apply_fido_pins, change_fido_pin
+
+    source = read_pin_source(pins_fd, pins_file, pins_command)
+    if source is not None:
+        run_batch("fido", FidoConnection, Ctap2, apply_fido_pins, source, jobs)
+        return
+
+    for device, info in iter_devices(FidoConnection):
+        with session_pool.session(device, info, FidoConnection, Ctap2) as ctap:
+            change_fido_pin(ctap)
 
     secho("\nComplete!", fg="magenta")
 
 
 @setup.command(help="Setup OpenPGP PINs")
-def openpgp():
-    for device, _ in iter_devices(SmartCardConnection):
-        with device.open_connection(SmartCardConnection) as conn:
-            session = OpenPgpSession(conn)
+@pin_source_options
+def openpgp(pins_fd: int | None, pins_file: Path | None, pins_command: str | None, jobs: int):
+    from yubikit.core.smartcard import SmartCardConnection
+    from yubikit.openpgp import OpenPgpSession
+
+    from yubigen.setup import apply_openpgp_pins, change_openpgp_admin_pin, change_openpgp_pin
+
+    source = read_pin_source(pins_fd, pins_file, pins_command)
+    if source is not None:
+        run_batch("openpgp", SmartCardConnection, OpenPgpSession, apply_openpgp_pins, source, jobs)
+        return
 
+    for device, info in iter_devices(SmartCardConnection):
+        with session_pool.session(device, info, SmartCardConnection, OpenPgpSession) as session:
             change_openpgp_pin(session)
             change_openpgp_admin_pin(session)
 
@@ -1,11 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import nullcontext
 from pathlib import Path
-from typing import cast
+from typing import TYPE_CHECKING, cast
+
 import click
 from click.termui import prompt, secho
 from click.utils import echo
 
-from yubigen import config
-from yubigen.ssh import MODULE, create_key, download_keys, register_device, unregister_device, write_config
+from yubigen.askpass import AskpassServer
+from yubigen.core import display_summary
+from yubigen.process import ProcessRunner, prefixed_writer
+from yubigen.ssh import (
+    MODULE,
+    ConfigBatch,
+    SyncPlan,
+    apply_sync,
+    create_key_async,
+    download_keys_async,
+    download_keys_native_async,
+    plan_sync,
+    register_device,
+    unregister_device,
+)
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.management import DeviceInfo
 
 
 @click.group(help="OpenSSH key management")
@@ -15,7 +37,11 @@ def ssh():
 
 @ssh.command(help="Create OpenSSH keys for YubiKeys")
 @click.option("--application", type=str, help="Application URL or name")
-def create(application: str | None):
+@click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of devices to operate on in parallel")
+@click.option("--timeout", type=click.FloatRange(0, min_open=True), help="Seconds to allow each ssh-keygen run")
+def create(application: str | None, jobs: int, timeout: float | None):
+    from yubigen import config
+
     cfg = config.read()
 
     if application is None:
@@ -23,23 +49,110 @@ def create(application: str | None):
 
     echo("Starting key creation process...")
 
-    for device, info in MODULE.iter_devices(True):
-        create_key(device, info, application)
-        write_config(cast(int, info.serial), cfg.ssh.applications, cfg.ssh.explicit_applications)
+    with (
+        ConfigBatch(cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check) as batch,
+        AskpassServer() if jobs > 1 else nullcontext() as askpass,
+    ):
+
+        async def job(device: YkmanDevice, info: DeviceInfo):
+            env = None if askpass is None else askpass.env(info.serial)
+            output = None if askpass is None else prefixed_writer(f"[SN {info.serial}] ")
+            await create_key_async(device, info, application, env, runner, output)
+            batch.add(cast(int, info.serial), info)
+
+        runner = ProcessRunner(jobs, timeout)
+        results = asyncio.run(MODULE.run_devices_async(job, jobs=jobs, abort=True))
+
+    if jobs > 1 or any(error is not None for _, error in results):
+        display_summary(results)
+    if any(error is not None for _, error in results):
+        exit(1)
 
     secho("\nComplete!", fg="magenta")
 
 
 @ssh.command(help="Download OpenSSH resident keys from YubiKeys")
-def download():
+@click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of devices to operate on in parallel")
+@click.option("--timeout", type=click.FloatRange(0, min_open=True), help="Seconds to allow each ssh-keygen run")
+@click.option("--native", is_flag=True, help="Read resident credentials over CTAP2 instead of running ssh-keygen")
+def download(jobs: int, timeout: float | None, native: bool):
+    from yubigen import config
+
     cfg = config.read()
 
     echo("Starting key download process...")
 
-    device_list = MODULE.iter_devices(True)
-    for device, info in device_list:
-        download_keys(device, info)
-        write_config(cast(int, info.serial), cfg.ssh.applications, cfg.ssh.explicit_applications)
+    with (
+        ConfigBatch(cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check) as batch,
+        AskpassServer() if jobs > 1 and not native else nullcontext() as askpass,
+    ):
+
+        async def job(device: YkmanDevice, info: DeviceInfo):
+            if native:
+                await download_keys_native_async(device, info)
+            else:
+                env = None if askpass is None else askpass.env(info.serial)
+                output = None if askpass is None else prefixed_writer(f"[SN {info.serial}] ")
+                await download_keys_async(device, info, env, runner, output)
+            batch.add(cast(int, info.serial), info)
+
+        runner = ProcessRunner(jobs, timeout)
+        results = asyncio.run(MODULE.run_devices_async(job, jobs=jobs, abort=True))
+
+    if jobs > 1 or any(error is not None for _, error in results):
+        display_summary(results)
+    if any(error is not None for _, error in results):
+        exit(1)
+
+    secho("\nComplete!", fg="magenta")
+
+
+@ssh.command(help="Create and download the OpenSSH keys missing for configured applications")
+@click.option("--dry-run", is_flag=True, help="Only print what would be done")
+@click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of devices to operate on in parallel")
+@click.option("--timeout", type=click.FloatRange(0, min_open=True), help="Seconds to allow each ssh-keygen run")
+def sync(dry_run: bool, jobs: int, timeout: float | None):
+    from yubigen import config
+
+    cfg = config.read()
+    if len(cfg.ssh.applications) < 1:
+        secho("No applications configured, nothing to do!", err=True, fg="red")
+        exit(1)
+
+    echo("Planning key synchronization...")
+
+    plans: dict[int, SyncPlan] = {}
+    with (
+        ConfigBatch(cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check) as batch,
+        AskpassServer() if jobs > 1 and not dry_run else nullcontext() as askpass,
+    ):
+
+        async def job(device: YkmanDevice, info: DeviceInfo):
+            plan = plans[cast(int, info.serial)] = await asyncio.to_thread(
+                plan_sync, device, info, cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check
+            )
+            if dry_run or plan.empty:
+                return
+
+            env = None if askpass is None else askpass.env(info.serial)
+            output = None if askpass is None else prefixed_writer(f"[SN {info.serial}] ")
+            await apply_sync(device, info, plan, env, runner, output)
+            batch.add(plan.serial, info)
+
+        runner = ProcessRunner(jobs, timeout)
+        results = asyncio.run(MODULE.run_devices_async(job, jobs=jobs, abort=True, quiet=True))
+
+    echo("\nDry run, planned:" if dry_run else "\nSummary:")
+    for info, error in results:
+        echo(f"  SN {info.serial}: ", nl=False)
+        if error is not None:
+            secho(f"failed ({type(error).__name__}: {error})", fg="red")
+        else:
+            plan = plans[cast(int, info.serial)]
+            secho(plan.describe(), fg="blue" if plan.empty else "green")
+
+    if any(error is not None for _, error in results):
+        exit(1)
 
     secho("\nComplete!", fg="magenta")
 
@@ -48,16 +161,18 @@ def download():
 @click.argument("device_path", type=click.Path(exists=True, dir_okay=False, readable=False, resolve_path=True, path_type=Path))
 @click.argument("device_name", type=str)
 def register(device_path: Path, device_name: str):
-    echo("Registering device...")
+    from yubigen import config
+    from yubigen.core import DeviceSelector
 
-    for device, info in MODULE.iter_devices(True, True):
-        if device.fingerprint == str(device_path):
-            assert info.serial
+    echo("Registering device...")
 
+    for _, info in MODULE.iter_devices(True, True, DeviceSelector(paths=[device_path])):
+        if info.serial is not None:
             register_device(device_name, info.serial)
 
             cfg = config.read()
-            write_config(info.serial, cfg.ssh.applications, cfg.ssh.explicit_applications)
+            with ConfigBatch(cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check) as batch:
+                batch.add(info.serial, info)
 
     secho("\nComplete!", fg="magenta")
 
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import getpass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import click
+from click.termui import secho
+from click.utils import echo
+
+from yubigen.core import display_summary, prompt_queue
+from yubigen.events import emit
+from yubigen.u2f import MODULE, AuthFile, default_authfile, default_origin, find_credential, make_credential
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.management import DeviceInfo
+
+
+@click.group(help="pam_u2f authfile management")
+def u2f():
+    pass
+
+
+@u2f.command(help="Register YubiKeys for pam_u2f users")
+@click.option("--user", "users", type=str, multiple=True, help="User to map the credentials to (default: current user)")
+@click.option("--users-file", type=click.File(), help="File with one user name per line")
+@click.option("--origin", type=str, help="Relying party of the credentials (default: pam://<hostname>)")
+@click.option(
+    "--authfile", type=click.Path(dir_okay=False, path_type=Path), help="Authfile to merge into (default: ~/.config/Yubico/u2f_keys)"
+)
+@click.option("--pin-verification", is_flag=True, help="Require the FIDO PIN when authenticating")
+@click.option("--jobs", "-j", type=click.IntRange(1), default=1, help="Number of devices to operate on in parallel")
+def register(
+    users: tuple[str, ...],
+    users_file: click.utils.LazyFile | None,
+    origin: str | None,
+    authfile: Path | None,
+    pin_verification: bool,
+    jobs: int,
+):
+    from fido2.ctap2.base import Ctap2
+
+    file_users: list[str] = [] if users_file is None else [str(line).strip() for line in users_file if str(line).strip()]  # pyright: ignore[reportAny]
+    user_list = list(dict.fromkeys([*users, *file_users]))
+    if len(user_list) < 1:
+        user_list = [getpass.getuser()]
+    if origin is None:
+        origin = default_origin()
+    if authfile is None:
+        authfile = default_authfile()
+
+    auth = AuthFile(authfile).load()
+
+    echo(f"Registering {len(user_list)} user{'' if len(user_list) == 1 else 's'} for {origin}...")
+
+    def job(device: YkmanDevice, info: DeviceInfo):
+        with auth.lock:
+            known = list(auth.key_handles)
+
+        with MODULE.session(device, info, Ctap2) as ctap:
+            key_handle = find_credential(ctap, origin, known)
+            if key_handle is not None:
+                credential = auth.key_handles[key_handle]
+            else:
+                pin = prompt_queue.prompt(f"[SN {info.serial}] Enter PIN for YubiKey", True) if pin_verification else None
+                credential = make_credential(ctap, origin, user_list[0] if len(user_list) == 1 else "pam_u2f", pin, info.serial)
+
+        added = sum(auth.add(user, credential) for user in user_list)
+        emit("credential_registered", info.serial, origin=origin, new=key_handle is None, mappings=added)
+        prompt_queue.notify(f"[SN {info.serial}] {'Existing' if key_handle is not None else 'New'} credential, {added} mapping(s) added")
+
+    results = MODULE.run_devices(job, jobs=jobs, abort=True)
+
+    changed = auth.write()
+    emit("authfile_written", path=str(authfile), changed=changed)
+    if changed:
+        echo(f"Updated {authfile}")
+    else:
+        echo(f"{authfile} is up to date")
+
+    if jobs > 1 or any(error is not None for _, error in results):
+        display_summary(results)
+    if any(error is not None for _, error in results):
+        exit(1)
+
+    secho("\nComplete!", fg="magenta")
+
+
+@u2f.command(name="list", help="List users and credentials in a pam_u2f authfile")
+@click.option("--authfile", type=click.Path(dir_okay=False, path_type=Path), help="Authfile to read (default: ~/.config/Yubico/u2f_keys)")
+def list_users(authfile: Path | None):
+    auth = AuthFile(default_authfile() if authfile is None else authfile).load()
+
+    for user, credentials in auth.users.items():
+        secho(user, fg="green", nl=False)
+        echo(f"  {len(credentials)} credential{'' if len(credentials) == 1 else 's'}")
+        for credential in credentials.values():
+            echo(f"  {credential.key_handle[:24]}...  {credential.cose_type}  {credential.options or '-'}")
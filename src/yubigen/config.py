@@ -1,10 +1,15 @@
-from collections.abc import Iterable, Mapping
-from tomllib import load
-from typing import ClassVar
+import os
+import pickle
+import shutil
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, ClassVar, Literal
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
-from yubigen.core import programdirs
+from yubigen.core import PICKLE_ERRORS, programdirs
+
+CACHE_VERSION = 5
 
 
 class PgpConfig(BaseModel):
@@ -15,21 +20,103 @@ class SshConfig(BaseModel):
     model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
 
     explicit_applications: bool = Field(default=False)
-    applications: Mapping[str, str | Iterable[str]] = Field(default_factory=lambda: {})
+    presence_check: bool = Field(default=False)
+    applications: Mapping[str, tuple[str, ...]] = Field(default_factory=lambda: {})
+
+    @field_validator("applications", mode="before")
+    @classmethod
+    def normalize_applications(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        if not isinstance(value, Mapping):
+            return value
+
+        return {
+            application: (hosts,) if isinstance(hosts, str) else tuple(hosts) if isinstance(hosts, list) else hosts  # pyright: ignore[reportUnknownArgumentType]
+            for application, hosts in value.items()  # pyright: ignore[reportUnknownVariableType]
+        }
+
+
+class DaemonConfig(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    on_insert: tuple[Literal["inventory", "ssh.download", "ssh.write_config"], ...] = Field(default=())
+    on_insert_command: str | None = Field(default=None)
+    pins_file: str | None = Field(default=None)
+    pins_command: str | None = Field(default=None)
+    settle: float = Field(default=0.5, ge=0)
+
+    @field_validator("on_insert", mode="before")
+    @classmethod
+    def normalize_on_insert(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        return tuple(value) if isinstance(value, list) else value  # pyright: ignore[reportUnknownArgumentType]
 
 
 class Config(BaseModel):
     model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
 
+    daemon: DaemonConfig = Field(default_factory=lambda: DaemonConfig.model_validate({}))
     pgp: PgpConfig = Field(default_factory=lambda: PgpConfig.model_validate({}))
     ssh: SshConfig = Field(default_factory=lambda: SshConfig.model_validate({}))
 
 
+memo: tuple[tuple[int, int] | None, Config] | None = None
+
+
+def config_path() -> Path:
+    return programdirs.user_config_path.joinpath("config.toml")
+
+
+def cache_path() -> Path:
+    return programdirs.user_cache_path.joinpath("config.pickle")
+
+
+def read_cache(key: tuple[int, int] | None) -> Config | None:
+    try:
+        with open(cache_path(), "rb") as file:
+            version, cached_key, config = pickle.load(file)  # pyright: ignore[reportAny]
+    except PICKLE_ERRORS:
+        return None
+
+    if version != CACHE_VERSION or cached_key != key or not isinstance(config, Config):
+        return None
+
+    return config
+
+
+def write_cache(key: tuple[int, int] | None, config: Config) -> None:
+    path = cache_path().with_name("config.pickle.new")
+    try:
+        with open(path, "wb", opener=lambda file, flags: os.open(file, flags, 0o600)) as file:
+            pickle.dump((CACHE_VERSION, key, config), file)
+        _ = shutil.move(path, cache_path())
+    except OSError:
+        path.unlink(missing_ok=True)
+
+
 def read():
+    from tomllib import load
+
+    global memo
+
+    path = config_path()
     try:
-        with open(programdirs.user_config_path.joinpath("config.toml"), "rb") as file:
-            data = load(file)
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
     except FileNotFoundError:
-        data = {}
+        key = None
+
+    if memo is not None and memo[0] == key:
+        return memo[1]
+
+    config = read_cache(key)
+    if config is None:
+        try:
+            with open(path, "rb") as file:
+                data = load(file)
+        except FileNotFoundError:
+            data = {}
+
+        config = Config.model_validate(data)
+        write_cache(key, config)
 
-    return Config.model_validate(data)
+    memo = (key, config)
+    return config
@@ -1,29 +1,450 @@
-from collections.abc import Generator
-from typing import cast
+from __future__ import annotations
 
-from click.termui import secho
+import asyncio
+import atexit
+import errno
+import os
+import pickle
+import shutil
+import subprocess
+from collections.abc import Awaitable, Callable, Generator, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from pathlib import Path
+from queue import Queue
+from threading import Lock, RLock, Thread, Timer
+from typing import TYPE_CHECKING, Any, TypeVar, cast
+
+from click.termui import prompt, secho
 from click.utils import echo
 from platformdirs import PlatformDirs
-from ykman.base import YkmanDevice
-from ykman.device import list_all_devices
-from yubikit import support
-from yubikit.core import PID, TRANSPORT, YUBIKEY, Connection
-from yubikit.core.fido import FidoConnection
-from yubikit.management import CAPABILITY, DeviceInfo
+
+from yubigen.backend import Backend, device_errors
+from yubigen.events import emit
+from yubigen.hotplug import HotplugWatcher
+from yubigen.locks import device_lock_names, lock_manager, retry_busy
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.core import PID, TRANSPORT, YUBIKEY, Connection
+    from yubikit.core.fido import FidoConnection
+    from yubikit.management import CAPABILITY, DeviceInfo
 
 
 programdirs = PlatformDirs("yubigen", "Xarvex", ensure_exists=True)
 
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+POOL_IDLE = 1.0
+
+PICKLE_ERRORS = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, TypeError, ValueError)
+
+S = TypeVar("S")
+
+
+class PromptQueue:
+    def __init__(self) -> None:
+        self.requests: Queue[tuple[str, bool, Future[str] | None]] = Queue()
+        self.thread: Thread | None = None
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.thread = Thread(target=self.run, name="yubigen-prompt", daemon=True)
+            self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            text, hide_input, future = self.requests.get()
+            if future is None:
+                secho(text, err=True, fg="yellow")
+                continue
+
+            try:
+                answer = prompt(text.rstrip().removesuffix(":"), default="", hide_input=hide_input, show_default=False)  # pyright: ignore[reportAny]
+                future.set_result(cast(str, answer))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def prompt(self, text: str, hide_input: bool = False) -> str:
+        self.start()
+
+        with span("prompt", kind="human", text=text):
+            future: Future[str] = Future()
+            self.requests.put((text, hide_input, future))
+            return future.result()
+
+    def notify(self, text: str) -> None:
+        self.start()
+
+        self.requests.put((text, False, None))
+
+
+prompt_queue = PromptQueue()
+
+
+class DeviceSelector:
+    def __init__(self, serials: Iterable[int] = (), paths: Iterable[str | os.PathLike[str]] = ()) -> None:
+        self.serials: frozenset[int] = frozenset(serials)
+        self.paths: frozenset[str] = frozenset(os.path.realpath(path) for path in paths)
+
+    def __bool__(self) -> bool:
+        return len(self.serials) > 0 or len(self.paths) > 0
+
+    @property
+    def key(self) -> tuple[tuple[int, ...], tuple[str, ...]]:
+        return tuple(sorted(self.serials)), tuple(sorted(self.paths))
+
+    def with_serials(self, serials: Iterable[int]) -> DeviceSelector:
+        return DeviceSelector(self.serials | set(serials), self.paths)
+
+    def matches(self, fingerprint: str, serial: int | None) -> bool | None:
+        if fingerprint in self.paths or (serial is not None and serial in self.serials):
+            return True
+        if serial is None and len(self.serials) > 0:
+            return None
+
+        return False
+
+
+device_selector: DeviceSelector | None = None
+
+
+def select_devices(serials: Iterable[int] = (), paths: Iterable[str | os.PathLike[str]] = ()) -> None:
+    global device_selector
+
+    selector = DeviceSelector(serials, paths)
+    device_selector = selector if selector else None
+
+
+def select_backend(spec: str) -> None:
+    from yubigen.backend import load_backend
+
+    device_cache.backend = load_backend(spec)
+
+
+def connection_kind(connection: type[Connection | FidoConnection]) -> str:
+    from yubikit.core.otp import OtpConnection
+    from yubikit.core.smartcard import SmartCardConnection
+
+    if issubclass(connection, SmartCardConnection):
+        return "ccid"
+    if issubclass(connection, OtpConnection):
+        return "otp"
+
+    return "ctap"
+
+
+class DeviceCache:
+    def __init__(self) -> None:
+        self.lock: Lock = Lock()
+        self.watcher: HotplugWatcher | None = None
+        self.enumerations: dict[tuple[str, object], list[tuple[YkmanDevice, DeviceInfo]]] = {}
+        self.stamps: dict[tuple[str, str], object] = {}
+        self.use_daemon: bool = True
+        self.backend: Backend = Backend()
+
+    @property
+    def path(self) -> Path:
+        name = "devices" if self.backend.name == "usb" else f"devices-{self.backend.name}"
+        return programdirs.user_runtime_path.joinpath(f"{name}.pickle")
+
+    def load(self) -> dict[tuple[str, str], tuple[object, int | None, DeviceInfo]]:
+        try:
+            with open(self.path, "rb") as file:
+                return cast("dict[tuple[str, str], tuple[object, int | None, DeviceInfo]]", pickle.load(file))
+        except PICKLE_ERRORS:
+            return {}
+
+    def save(self, entries: dict[tuple[str, str], tuple[object, int | None, DeviceInfo]]) -> None:
+        path = self.path.with_name(f"{self.path.name}.new")
+        with open(path, "wb", opener=lambda file, flags: os.open(file, flags, 0o600)) as file:
+            pickle.dump(entries, file)
+        _ = shutil.move(path, self.path)
+
+    def stamp(self, kind: str, fingerprint: str) -> object:
+        return self.backend.stamp(kind, fingerprint)
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.enumerations.clear()
+            self.path.unlink(missing_ok=True)
+
+    def enumerate(
+        self,
+        connection: type[Connection | FidoConnection],
+        selector: DeviceSelector | None = None,
+    ) -> list[tuple[YkmanDevice, DeviceInfo]]:
+        from yubikit.core.fido import FidoConnection
+        from yubikit.core.otp import OtpConnection
+        from yubikit.core.smartcard import SmartCardConnection
+
+        kind = connection_kind(connection)
+        base = SmartCardConnection if kind == "ccid" else OtpConnection if kind == "otp" else connection
+
+        if selector is not None and len(selector.paths) > 0 and kind != "ctap":
+            paths = DeviceSelector(paths=selector.paths)
+            selector = selector.with_serials(info.serial for _, info in self.enumerate(FidoConnection, paths) if info.serial is not None)
+            if len(selector.serials) < 1:
+                return []
+
+        memo_key = (kind, None if selector is None else selector.key)
+        with self.lock, span("enumerate", connection=kind) as trace_args:
+            if self.watcher is None:
+                self.watcher = HotplugWatcher()
+            elif self.watcher.changed():
+                self.enumerations.clear()
+
+            if memo_key in self.enumerations:
+                trace_args["cached"] = True
+                return list(self.enumerations[memo_key])
+            if selector is not None and (kind, None) in self.enumerations:
+                trace_args["cached"] = True
+                return [
+                    (device, info)
+                    for device, info in self.enumerations[(kind, None)]
+                    if selector.matches(str(device.fingerprint), info.serial)
+                ]
+
+            try:
+                raw_devices = self.backend.list_devices(kind)
+            except device_errors() as e:
+                trace_args["error"] = f"{type(e).__name__}: {e}"
+                secho(f"Could not list {kind.upper()} devices: {e}", err=True, fg="yellow")
+                return []
+
+            from yubigen.daemon import encode_stamp, request_devices
+
+            entries = self.load()
+            remote = request_devices(kind) if self.use_daemon else None
+            if self.use_daemon:
+                trace_args["daemon"] = remote is not None
+            seen: set[tuple[str, str]] = set()
+            found: set[int] = set()
+            device_list: list[tuple[YkmanDevice, DeviceInfo]] = []
+            for device in raw_devices:
+                key = (kind, str(device.fingerprint))
+                stamp = self.stamps[key] = self.stamp(kind, str(device.fingerprint))
+                seen.add(key)
+
+                entry = entries.get(key)
+                remote_entry = None if remote is None else remote.get(str(device.fingerprint))
+                if stamp is not None and remote_entry is not None and remote_entry[0] == encode_stamp(stamp):
+                    info = remote_entry[1]
+                    entry = entries[key] = (stamp, info.serial, info)
+                fresh = entry is not None and stamp is not None and entry[0] == stamp
+                if selector is not None:
+                    serial = entry[1] if entry is not None and fresh else self.backend.serial_hint(kind, str(device.fingerprint))
+                    match = selector.matches(str(device.fingerprint), serial)
+                    if match is False or (match is None and selector.serials <= found):
+                        trace_args["skipped"] = trace_args.get("skipped", 0) + 1
+                        continue
+
+                if entry is not None and fresh:
+                    info = entry[2]
+                else:
+                    names = device_lock_names(str(device.fingerprint), self.backend.serial_hint(kind, str(device.fingerprint)))
+                    try:
+                        with lock_manager.hold(names), span("read_info", device=str(device.fingerprint)) as read_args:
+                            info = retry_busy(
+                                partial(self.backend.read_info, device, cast("type[Connection]", base)), str(device.fingerprint)
+                            )
+                            read_args["serial"] = info.serial
+                    except device_errors() as e:
+                        secho(f"Could not read {device.fingerprint}: {e}", err=True, fg="yellow")
+                        _ = entries.pop(key, None)
+                        continue
+                    if stamp is not None:
+                        entries[key] = (stamp, info.serial, info)
+                    else:
+                        _ = entries.pop(key, None)
+
+                if selector is not None and not selector.matches(str(device.fingerprint), info.serial):
+                    continue
+                if info.serial is not None:
+                    found.add(info.serial)
+                device_list.append((device, info))
+
+            for key in [key for key in entries if key[0] == kind and key not in seen]:
+                del entries[key]
+            for key in [key for key in self.stamps if key[0] == kind and key not in seen]:
+                del self.stamps[key]
+            self.save(entries)
+
+            self.enumerations[memo_key] = device_list
+            return list(device_list)
+
+
+device_cache = DeviceCache()
+
+
+class PooledDevice:
+    def __init__(self, device: YkmanDevice, connection: type[Connection | FidoConnection], serial: int | None = None) -> None:
+        self.device: YkmanDevice = device
+        self.connection_type: type[Connection | FidoConnection] = connection
+        self.serial: int | None = serial
+        self.locks: ExitStack | None = None
+        self.lock: RLock = RLock()
+        self.users: int = 0
+        self.idle: Timer | None = None
+        self.connection: Connection | None = None
+        self.sessions: dict[Callable[[Any], Any], Any] = {}  # pyright: ignore[reportExplicitAny]
+
+    def open(self) -> Connection:
+        if self.connection is None:
+            if self.locks is None:
+                locks = ExitStack()
+                locks.enter_context(lock_manager.hold(device_lock_names(str(self.device.fingerprint), self.serial)))
+                self.locks = locks
+
+            with span("open_connection", device=str(self.device.fingerprint), pooled=True):
+                self.connection = retry_busy(
+                    lambda: self.device.open_connection(cast("type[Connection]", self.connection_type)), str(self.device.fingerprint)
+                )
+
+        return self.connection
+
+    def session(self, factory: Callable[[Any], S]) -> S:  # pyright: ignore[reportExplicitAny]
+        if factory not in self.sessions:
+            self.sessions[factory] = factory(self.open())
+
+        return cast(S, self.sessions[factory])
+
+    def checkout(self) -> None:
+        self.users += 1
+        if self.idle is not None:
+            self.idle.cancel()
+            self.idle = None
+
+    def checkin(self) -> None:
+        self.users -= 1
+        if self.users == 0 and self.connection is not None:
+            self.idle = Timer(POOL_IDLE, self.expire)
+            self.idle.daemon = True
+            self.idle.start()
+
+    def expire(self) -> None:
+        with self.lock:
+            if self.users == 0:
+                self.close()
+
+    def close(self) -> None:
+        if self.idle is not None:
+            self.idle.cancel()
+            self.idle = None
+        self.sessions.clear()
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except device_errors() as e:
+                secho(f"Could not close {self.device.fingerprint}: {e}", err=True, fg="yellow")
+            self.connection = None
+        if self.locks is not None:
+            self.locks.close()
+            self.locks = None
+
+
+class SessionPool:
+    def __init__(self) -> None:
+        self.lock: Lock = Lock()
+        self.entries: dict[tuple[str, int | str], PooledDevice] = {}
+        self.registered: bool = False
+
+    def entry(self, device: YkmanDevice, info: DeviceInfo, connection: type[Connection | FidoConnection]) -> PooledDevice:
+        key = (connection.__name__, str(device.fingerprint) if info.serial is None else info.serial)
+        with self.lock:
+            if not self.registered:
+                _ = atexit.register(self.close)
+                self.registered = True
+
+            entry = self.entries.get(key)
+            if entry is None or entry.device.fingerprint != device.fingerprint:
+                if entry is not None:
+                    entry.close()
+                entry = self.entries[key] = PooledDevice(device, connection, info.serial)
+
+            return entry
+
+    @contextmanager
+    def connection(
+        self,
+        device: YkmanDevice,
+        info: DeviceInfo,
+        connection: type[Connection | FidoConnection],
+    ) -> Generator[Any, None, None]:  # pyright: ignore[reportExplicitAny]
+        entry = self.entry(device, info, connection)
+        with entry.lock:
+            entry.checkout()
+            try:
+                yield entry.open()
+            except BaseException:
+                entry.close()
+                raise
+            finally:
+                entry.checkin()
+
+    @contextmanager
+    def session(
+        self,
+        device: YkmanDevice,
+        info: DeviceInfo,
+        connection: type[Connection | FidoConnection],
+        factory: Callable[[Any], S],  # pyright: ignore[reportExplicitAny]
+    ) -> Generator[S, None, None]:
+        entry = self.entry(device, info, connection)
+        with entry.lock:
+            entry.checkout()
+            try:
+                yield entry.session(factory)
+            except BaseException:
+                entry.close()
+                raise
+            finally:
+                entry.checkin()
+
+    def release(self, serial: int | None = None, connection: type[Connection | FidoConnection] | None = None) -> None:
+        with self.lock:
+            keys = [
+                key
+                for key in self.entries
+                if (serial is None or key[1] == serial)
+                and (connection is None or issubclass(self.entries[key].connection_type, connection))
+            ]
+            entries = [self.entries.pop(key) for key in keys]
+
+        for entry in entries:
+            with entry.lock:
+                entry.close()
+
+    def close(self) -> None:
+        self.release()
+
+
+session_pool = SessionPool()
+
 
 def list_devices(
     connection: type[Connection | FidoConnection],
     /,
     abort: bool = False,
     quiet: bool = False,
+    selector: DeviceSelector | None = None,
 ) -> list[tuple[YkmanDevice, DeviceInfo]]:
-    device_list = list_all_devices([cast(type[Connection], connection)])
+    device_list = device_cache.enumerate(connection, device_selector if selector is None else selector)
+
+    for device, info in device_list:
+        emit(
+            "enumerated",
+            info.serial,
+            connection=connection_kind(connection),
+            path=str(device.fingerprint),
+            version=str(info.version),
+            form_factor=str(info.form_factor),
+        )
 
     if len(device_list) < 1:
+        emit("skipped", connection=connection_kind(connection), reason="no devices found")
         if not quiet:
             secho("No devices found, nothing to do!", err=True, fg="red")
         if abort:
@@ -40,8 +461,9 @@ def iter_devices(
     /,
     abort: bool = False,
     quiet: bool = False,
+    selector: DeviceSelector | None = None,
 ) -> Generator[tuple[YkmanDevice, DeviceInfo], None, None]:
-    device_list = list_devices(connection, abort, quiet)
+    device_list = list_devices(connection, abort, quiet, selector)
     skipped = 0
 
     for device, info in device_list:
@@ -51,12 +473,14 @@ def iter_devices(
         if info.serial is None:
             if not quiet:
                 secho("Skipping device as it has no serial number.", err=True, fg="blue")
+            emit("skipped", path=str(device.fingerprint), reason="no serial number")
             skipped += 1
         elif capability is None or capability_enabled(capability, device, info):
             yield device, info
         else:
             if not quiet:
                 secho(f"Skipping device as {capability.display_name} over {device.transport} is disabled.", err=True, fg="blue")
+            emit("skipped", info.serial, reason=f"{capability.display_name} over {device.transport} is disabled")
             skipped += 1
 
     if skipped != 0 and skipped == len(device_list):
@@ -71,6 +495,8 @@ def capability_enabled(
     device_or_transport: YkmanDevice | TRANSPORT,
     info: DeviceInfo,
 ) -> bool:
+    from ykman.base import YkmanDevice
+
     enabled = info.config.enabled_capabilities.get(
         device_or_transport.transport if isinstance(device_or_transport, YkmanDevice) else device_or_transport
     )
@@ -81,6 +507,10 @@ def display_name(
     device_or_pid_or_yubikey_type: YkmanDevice | PID | YUBIKEY,
     info: DeviceInfo,
 ) -> None:
+    from ykman.base import YkmanDevice
+    from yubikit import support
+    from yubikit.core import PID
+
     pid_or_yubikey_type = (
         device_or_pid_or_yubikey_type.pid if isinstance(device_or_pid_or_yubikey_type, YkmanDevice) else device_or_pid_or_yubikey_type
     )
@@ -91,3 +521,127 @@ def display_name(
     echo(" (SN: ", nl=False)
     secho("-" if info.serial is None else info.serial, nl=False, fg="red" if info.serial is None else "green")
     echo(")")
+
+
+def fsync_paths(paths: Iterable[Path]) -> None:
+    for path in dict.fromkeys(paths):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def exchange_paths(source: Path, destination: Path) -> None:
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    try:
+        result = int(libc.renameat2(AT_FDCWD, bytes(source), AT_FDCWD, bytes(destination), RENAME_EXCHANGE))  # pyright: ignore[reportAny]
+    except AttributeError:
+        result = -1
+        ctypes.set_errno(errno.ENOSYS)
+    if result == 0:
+        return
+
+    error = ctypes.get_errno()
+    if error not in (errno.ENOSYS, errno.EINVAL, errno.ENOENT):
+        raise OSError(error, os.strerror(error), str(source))
+
+    backup = destination.with_name(f"{destination.name}.old")
+    shutil.rmtree(backup, ignore_errors=True)
+    if destination.exists():
+        destination.rename(backup)
+    source.rename(destination)
+    if backup.exists():
+        backup.rename(source)
+
+
+def job_errors() -> tuple[type[Exception], ...]:
+    return (*device_errors(), LookupError, RuntimeError, subprocess.SubprocessError)
+
+
+def traced_job(fn: Callable[[YkmanDevice, DeviceInfo], None], device: YkmanDevice, info: DeviceInfo) -> None:
+    with span("device", info.serial):
+        try:
+            fn(device, info)
+        except Exception as e:
+            emit("error", info.serial, error=f"{type(e).__name__}: {e}")
+            raise
+    emit("completed", info.serial)
+
+
+def run_devices(
+    fn: Callable[[YkmanDevice, DeviceInfo], None],
+    devices: Iterable[tuple[YkmanDevice, DeviceInfo]],
+    /,
+    jobs: int = 1,
+) -> list[tuple[DeviceInfo, BaseException | None]]:
+    results: list[tuple[DeviceInfo, BaseException | None]] = []
+
+    if jobs <= 1:
+        for device, info in devices:
+            try:
+                traced_job(fn, device, info)
+            except job_errors() as e:
+                secho(f"Failed: {e}", err=True, fg="red")
+                results.append((info, e))
+            else:
+                results.append((info, None))
+        return results
+
+    device_list = list(devices)
+    with ThreadPoolExecutor(jobs, "yubigen-device") as executor:
+        futures = [(info, executor.submit(traced_job, fn, device, info)) for device, info in device_list]
+        for info, future in futures:
+            error = future.exception()
+            if error is not None and not isinstance(error, job_errors()):
+                raise error
+            results.append((info, error))
+
+    return results
+
+
+async def run_devices_async(
+    fn: Callable[[YkmanDevice, DeviceInfo], Awaitable[None]],
+    devices: Iterable[tuple[YkmanDevice, DeviceInfo]],
+    /,
+    jobs: int = 1,
+) -> list[tuple[DeviceInfo, BaseException | None]]:
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def job(device: YkmanDevice, info: DeviceInfo) -> None:
+        async with semaphore:
+            with span("device", info.serial):
+                try:
+                    await fn(device, info)
+                except Exception as e:
+                    secho(f"Failed (SN {info.serial}): {e}", err=True, fg="red")
+                    emit("error", info.serial, error=f"{type(e).__name__}: {e}")
+                    raise
+            emit("completed", info.serial)
+
+    device_list = list(devices)
+    outcomes = await asyncio.gather(*(job(device, info) for device, info in device_list), return_exceptions=True)
+
+    results: list[tuple[DeviceInfo, BaseException | None]] = []
+    for (_, info), outcome in zip(device_list, outcomes):
+        if isinstance(outcome, BaseException) and not isinstance(outcome, job_errors()):
+            raise outcome
+        results.append((info, outcome))
+
+    return results
+
+
+def display_summary(results: Iterable[tuple[DeviceInfo, BaseException | None]]) -> None:
+    echo("\nSummary:")
+    for info, error in results:
+        echo(f"  SN {'-' if info.serial is None else info.serial}: ", nl=False)
+        if error is None:
+            secho("ok", fg="green")
+        else:
+            secho(f"failed ({type(error).__name__}: {error})", fg="red")
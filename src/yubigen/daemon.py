@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shlex
+import socket
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from click.termui import secho
+
+from yubigen.core import device_cache, job_errors, programdirs
+from yubigen.events import emit
+from yubigen.hotplug import HotplugWatcher
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.management import DeviceInfo
+
+    from yubigen.config import DaemonConfig
+
+
+def socket_path() -> Path:
+    return programdirs.user_runtime_path.joinpath("daemon.sock")
+
+
+def request(method: str, timeout: float = 0.5, **params: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+    path = socket_path()
+    if not path.exists():
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(str(path))
+            with conn.makefile("rwb") as file:
+                _ = file.write(json.dumps({"method": method, "params": params}).encode() + b"\n")
+                file.flush()
+                response = json.loads(file.readline())  # pyright: ignore[reportAny]
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(response, dict) or "error" in response:
+        return None
+
+    return response.get("result")  # pyright: ignore[reportUnknownMemberType]
+
+
+def encode_stamp(stamp: object) -> str:
+    return json.dumps(stamp)
+
+
+def encode_info(info: DeviceInfo) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+    config = info.config
+    return {
+        "config": {
+            "enabled_capabilities": {transport.value: int(capabilities) for transport, capabilities in config.enabled_capabilities.items()},
+            "auto_eject_timeout": config.auto_eject_timeout,
+            "challenge_response_timeout": config.challenge_response_timeout,
+            "device_flags": None if config.device_flags is None else int(config.device_flags),
+            "nfc_restricted": config.nfc_restricted,
+        },
+        "serial": info.serial,
+        "version": list(info.version),
+        "form_factor": int(info.form_factor),
+        "supported_capabilities": {transport.value: int(capabilities) for transport, capabilities in info.supported_capabilities.items()},
+        "is_locked": info.is_locked,
+        "is_fips": info.is_fips,
+        "is_sky": info.is_sky,
+        "part_number": info.part_number,
+        "fips_capable": int(info.fips_capable),
+        "fips_approved": int(info.fips_approved),
+        "pin_complexity": info.pin_complexity,
+        "reset_blocked": int(info.reset_blocked),
+        "fps_version": None if info.fps_version is None else list(info.fps_version),
+        "stm_version": None if info.stm_version is None else list(info.stm_version),
+        "version_qualifier": {
+            "version": list(info.version_qualifier.version),
+            "type": int(info.version_qualifier.type),
+            "iteration": info.version_qualifier.iteration,
+        },
+    }
+
+
+def decode_info(data: dict[str, Any]) -> DeviceInfo:  # pyright: ignore[reportExplicitAny]
+    from yubikit.core import TRANSPORT, Version
+    from yubikit.management import CAPABILITY, DEVICE_FLAG, FORM_FACTOR, RELEASE_TYPE, DeviceConfig, DeviceInfo, VersionQualifier
+
+    config = data["config"]  # pyright: ignore[reportAny]
+    qualifier = data["version_qualifier"]  # pyright: ignore[reportAny]
+    return DeviceInfo(
+        config=DeviceConfig(
+            {TRANSPORT(transport): CAPABILITY(value) for transport, value in config["enabled_capabilities"].items()},  # pyright: ignore[reportAny]
+            config["auto_eject_timeout"],
+            config["challenge_response_timeout"],
+            None if config["device_flags"] is None else DEVICE_FLAG(config["device_flags"]),
+            config["nfc_restricted"],
+        ),
+        serial=data["serial"],
+        version=Version(*data["version"]),  # pyright: ignore[reportAny]
+        form_factor=FORM_FACTOR(data["form_factor"]),
+        supported_capabilities={TRANSPORT(transport): CAPABILITY(value) for transport, value in data["supported_capabilities"].items()},  # pyright: ignore[reportAny]
+        is_locked=bool(data["is_locked"]),
+        is_fips=bool(data["is_fips"]),
+        is_sky=bool(data["is_sky"]),
+        part_number=data["part_number"],
+        fips_capable=CAPABILITY(data["fips_capable"]),
+        fips_approved=CAPABILITY(data["fips_approved"]),
+        pin_complexity=bool(data["pin_complexity"]),
+        reset_blocked=CAPABILITY(data["reset_blocked"]),
+        fps_version=None if data["fps_version"] is None else Version(*data["fps_version"]),  # pyright: ignore[reportAny]
+        stm_version=None if data["stm_version"] is None else Version(*data["stm_version"]),  # pyright: ignore[reportAny]
+        version_qualifier=VersionQualifier(Version(*qualifier["version"]), RELEASE_TYPE(qualifier["type"]), qualifier["iteration"]),  # pyright: ignore[reportAny]
+    )
+
+
+def request_devices(kind: str) -> dict[str, tuple[str, DeviceInfo]] | None:
+    result = request("devices", kind=kind)
+    if not isinstance(result, dict):
+        return None
+
+    try:
+        return {str(fingerprint): (str(entry["stamp"]), decode_info(entry["info"])) for fingerprint, entry in result.items()}  # pyright: ignore[reportUnknownArgumentType, reportUnknownVariableType]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def log(text: str, fg: str | None = None) -> None:
+    secho(f"{datetime.now().strftime('%H:%M:%S')} {text}", err=True, fg=fg)
+
+
+class Daemon:
+    def __init__(self, config: DaemonConfig) -> None:
+        device_cache.use_daemon = False
+
+        self.config: DaemonConfig = config
+        self.watcher: HotplugWatcher = HotplugWatcher()
+        self.devices: dict[str, list[tuple[YkmanDevice, DeviceInfo, object]]] = {}
+        self.serials: set[int] = set()
+        self.refresh_handle: asyncio.TimerHandle | None = None
+        self.refreshing: asyncio.Lock = asyncio.Lock()
+        self.stopped: asyncio.Event = asyncio.Event()
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    async def refresh(self) -> None:
+        from yubigen.ssh import sync_presence
+
+        async with self.refreshing:
+            with span("daemon_refresh") as trace_args:
+                device_cache.enumerations.clear()
+                devices = {kind: await asyncio.to_thread(self.enumerate, kind, connection) for kind, connection in connections().items()}
+                serials = {info.serial for device_list in devices.values() for _, info, _ in device_list if info.serial is not None}
+                trace_args["devices"] = len(serials)
+
+            inserted = serials - self.serials
+            for serial in sorted(serials ^ self.serials):
+                log(f"SN {serial} {'inserted' if serial in inserted else 'removed'}", "green" if serial in inserted else "blue")
+                emit("inserted" if serial in inserted else "removed", serial)
+
+            first = len(self.devices) < 1
+            self.devices = devices
+            self.serials = serials
+            await asyncio.to_thread(sync_presence, serials)
+            if not first:
+                for serial in sorted(inserted):
+                    self.spawn(self.on_insert(serial))
+
+    def enumerate(self, kind: str, connection: type[Any]) -> list[tuple[YkmanDevice, DeviceInfo, object]]:  # pyright: ignore[reportExplicitAny]
+        return [
+            (device, info, device_cache.stamps.get((kind, str(device.fingerprint)))) for device, info in device_cache.enumerate(connection)
+        ]
+
+    def schedule_refresh(self) -> None:
+        if not self.watcher.read_events():
+            return
+
+        if self.refresh_handle is not None:
+            self.refresh_handle.cancel()
+        self.refresh_handle = asyncio.get_running_loop().call_later(self.config.settle, lambda: self.spawn(self.refresh()))
+
+    def spawn(self, coroutine: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        task = asyncio.ensure_future(coroutine)  # pyright: ignore[reportAny]
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def find(self, kind: str, serial: int) -> tuple[YkmanDevice, DeviceInfo] | None:
+        return next(((device, info) for device, info, _ in self.devices.get(kind, []) if info.serial == serial), None)
+
+    async def on_insert(self, serial: int) -> None:
+        import sqlite3
+
+        from yubigen import config
+
+        cfg = await asyncio.to_thread(config.read)
+        for action in self.config.on_insert:
+            try:
+                with span("daemon_action", serial, action=action):
+                    await self.run_action(action, serial, cfg)
+            except (*job_errors(), sqlite3.Error) as e:
+                log(f"SN {serial} {action} failed: {e}", "red")
+                emit("error", serial, action=action, error=f"{type(e).__name__}: {e}")
+            else:
+                log(f"SN {serial} {action} done")
+                emit("action_completed", serial, action=action)
+
+        if self.config.on_insert_command is not None:
+            env = dict(os.environ)
+            env["YUBIGEN_SERIAL"] = str(serial)
+            process = await asyncio.create_subprocess_exec(
+                *shlex.split(self.config.on_insert_command), env=env, stdin=asyncio.subprocess.DEVNULL
+            )
+            if await process.wait() != 0:
+                log(f"SN {serial} on_insert_command exited with {process.returncode}", "red")
+
+    async def run_action(self, action: str, serial: int, cfg: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        from yubigen import inventory, ssh
+
+        found = self.find("ctap", serial) or self.find("ccid", serial)
+        if action == "inventory" and found is not None:
+            with inventory.open_inventory() as db, db:
+                inventory.record_device(db, found[1])
+        elif action == "ssh.download":
+            fido = self.find("ctap", serial)
+            if fido is None:
+                raise LookupError("FIDO interface not available")
+            pin = await asyncio.to_thread(self.fido_pin, serial)
+            if pin is None:
+                raise LookupError("No FIDO PIN configured, set daemon.pins_file or daemon.pins_command")
+            await ssh.download_keys_native_async(fido[0], fido[1], pin)
+        elif action == "ssh.write_config":
+            with ssh.ConfigBatch(cfg.ssh.applications, cfg.ssh.explicit_applications, cfg.ssh.presence_check) as batch:  # pyright: ignore[reportAny]
+                batch.add(serial, None if found is None else found[1])
+
+    def fido_pin(self, serial: int) -> str | None:
+        from yubigen.pins import PinSource, read_manifest_file
+
+        manifest = None if self.config.pins_file is None else read_manifest_file(Path(self.config.pins_file).expanduser())
+        return PinSource(manifest, self.config.pins_command).get(serial, "fido", "pin")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)  # pyright: ignore[reportAny]
+                    response = {"result": await self.dispatch(str(message["method"]), message.get("params") or {})}  # pyright: ignore[reportAny]
+                except (*job_errors(), TypeError) as e:
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, params: dict[str, Any]) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        if method == "ping":
+            return {"pid": os.getpid(), "devices": sorted(self.serials)}
+        if method == "devices":
+            async with self.refreshing:
+                kind = str(params["kind"])
+                return {
+                    str(device.fingerprint): {"stamp": encode_stamp(stamp), "info": encode_info(info)}
+                    for device, info, stamp in self.devices.get(kind, [])
+                    if stamp is not None
+                }
+        if method == "refresh":
+            await self.refresh()
+            return sorted(self.serials)
+        if method == "stop":
+            self.stopped.set()
+            return True
+
+        raise ValueError(f"Unknown method '{method}'")
+
+    async def serve(self) -> None:
+        path = socket_path()
+        if request("ping") is not None:
+            raise RuntimeError(f"A daemon is already listening on {path}")
+        path.unlink(missing_ok=True)
+
+        server = await asyncio.start_unix_server(self.handle, str(path))
+        path.chmod(0o600)
+        loop = asyncio.get_running_loop()
+        if self.watcher.fd is not None:
+            loop.add_reader(self.watcher.fd, self.schedule_refresh)
+        else:
+            log("inotify is not available, polling for hotplug events", "yellow")
+            self.spawn(self.poll())
+
+        try:
+            await self.refresh()
+            log(f"Listening on {path}")
+            async with server:
+                _ = await self.stopped.wait()
+        finally:
+            if self.watcher.fd is not None:
+                _ = loop.remove_reader(self.watcher.fd)
+            self.watcher.close()
+            path.unlink(missing_ok=True)
+
+    async def poll(self) -> None:
+        while not self.stopped.is_set():
+            await asyncio.sleep(max(self.config.settle, 1.0))
+            if await asyncio.to_thread(self.watcher.changed):
+                await self.refresh()
+
+
+def connections() -> dict[str, type[Any]]:  # pyright: ignore[reportExplicitAny]
+    from yubikit.core.fido import FidoConnection
+    from yubikit.core.smartcard import SmartCardConnection
+
+    return {"ctap": FidoConnection, "ccid": SmartCardConnection}
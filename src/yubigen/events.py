@@ -0,0 +1,44 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import IO, Any
+
+
+class Emitter:
+    def __init__(self) -> None:
+        self.stream: IO[str] | None = None
+        self.lock: threading.Lock = threading.Lock()
+        self.host: str = socket.gethostname()
+
+    @property
+    def enabled(self) -> bool:
+        return self.stream is not None
+
+    def configure(self) -> None:
+        if self.stream is not None:
+            return
+
+        sys.stdout.flush()
+        self.stream = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def emit(self, event: str, serial: int | None = None, **fields: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        if self.stream is None:
+            return
+
+        record: dict[str, Any] = {"event": event, "time": time.time(), "host": self.host, "pid": os.getpid()}  # pyright: ignore[reportExplicitAny]
+        if serial is not None:
+            record["serial"] = serial
+        record.update(fields)
+
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            _ = self.stream.write(line)
+            self.stream.flush()
+
+
+emitter = Emitter()
+emit = emitter.emit
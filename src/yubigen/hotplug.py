@@ -0,0 +1,151 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from hashlib import sha256
+from pathlib import Path
+
+DEV_PATH = Path("/dev")
+USB_DEV_PATH = Path("/dev/bus/usb")
+USB_SYSFS_PATH = Path("/sys/bus/usb/devices")
+HIDRAW_SYSFS_PATH = Path("/sys/class/hidraw")
+
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_ISDIR = 0x40000000
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def device_stamp(path: str | os.PathLike[str]) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_ino, stat.st_ctime_ns
+
+
+def usb_serial(path: str | os.PathLike[str]) -> int | None:
+    try:
+        device = HIDRAW_SYSFS_PATH.joinpath(Path(path).name, "device").resolve(strict=True)
+    except OSError:
+        return None
+
+    for parent in [device, *device.parents]:
+        if parent.joinpath("idVendor").exists():
+            try:
+                value = parent.joinpath("serial").read_text().strip()
+            except OSError:
+                return None
+            return int(value) if value.isdigit() else None
+
+
+def signature() -> str:
+    digest = sha256()
+
+    try:
+        for path in sorted(DEV_PATH.glob("hidraw*")):
+            digest.update(f"{path.name}:{device_stamp(path)}\n".encode())
+    except OSError:
+        pass
+    try:
+        for path in sorted(USB_DEV_PATH.glob("*/*")):
+            digest.update(f"{path.parent.name}/{path.name}:{device_stamp(path)}\n".encode())
+    except OSError:
+        pass
+    try:
+        for name in sorted(os.listdir(USB_SYSFS_PATH)):
+            digest.update(f"{name}\n".encode())
+    except OSError:
+        pass
+
+    return digest.hexdigest()
+
+
+class HotplugWatcher:
+    def __init__(self) -> None:
+        self.fd: int | None = None
+        self.libc: ctypes.CDLL | None = None
+        self.watches: dict[int, Path] = {}
+        self.signature: str = signature()
+
+        libc_name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+            fd = int(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))  # pyright: ignore[reportAny]
+        except (AttributeError, OSError):
+            return
+        if fd < 0:
+            return
+
+        self.fd = fd
+        self.libc = libc
+        for path in [DEV_PATH, USB_DEV_PATH]:
+            self.watch(path)
+        try:
+            for path in sorted(USB_DEV_PATH.iterdir()):
+                self.watch(path)
+        except OSError:
+            pass
+
+    def watch(self, path: Path) -> None:
+        assert self.fd is not None and self.libc is not None
+
+        wd = int(self.libc.inotify_add_watch(self.fd, bytes(path), IN_CREATE | IN_DELETE | IN_ATTRIB))  # pyright: ignore[reportAny]
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def fileno(self) -> int:
+        if self.fd is None:
+            raise OSError("inotify is not available")
+
+        return self.fd
+
+    def read_events(self) -> bool:
+        assert self.fd is not None
+
+        relevant = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return relevant
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+
+                path = self.watches.get(wd)
+                if path == USB_DEV_PATH and mask & IN_CREATE and mask & IN_ISDIR:
+                    self.watch(USB_DEV_PATH.joinpath(os.fsdecode(name)))
+                if path != DEV_PATH or name.startswith(b"hidraw"):
+                    relevant = True
+
+    def changed(self) -> bool:
+        if self.fd is not None:
+            _ = self.read_events()
+
+        current = signature()
+        changed = current != self.signature
+        self.signature = current
+
+        return changed
+
+    def wait(self, timeout: float | None = None) -> bool:
+        if self.fd is None:
+            return self.changed()
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        return len(ready) > 0 and self.changed()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
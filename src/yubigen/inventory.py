@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Iterable, Mapping
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from yubigen.core import programdirs
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    from yubikit.management import DeviceInfo
+
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    serial INTEGER PRIMARY KEY,
+    version TEXT,
+    form_factor TEXT,
+    seen_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ssh_keys (
+    serial INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    application TEXT NOT NULL,
+    public_key TEXT,
+    fingerprint TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (serial, file)
+);
+CREATE INDEX IF NOT EXISTS ssh_keys_application ON ssh_keys (application);
+CREATE INDEX IF NOT EXISTS ssh_keys_fingerprint ON ssh_keys (fingerprint);
+CREATE TABLE IF NOT EXISTS ssh_hosts (
+    serial INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    host TEXT NOT NULL,
+    PRIMARY KEY (serial, file, host)
+);
+CREATE INDEX IF NOT EXISTS ssh_hosts_host ON ssh_hosts (host);
+CREATE TABLE IF NOT EXISTS pgp_keys (
+    serial INTEGER NOT NULL,
+    slot TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    subkey TEXT,
+    transferred_at REAL NOT NULL,
+    PRIMARY KEY (serial, slot)
+);
+CREATE INDEX IF NOT EXISTS pgp_keys_fingerprint ON pgp_keys (fingerprint);
+CREATE INDEX IF NOT EXISTS pgp_keys_subkey ON pgp_keys (subkey);
+CREATE TABLE IF NOT EXISTS registrations (
+    name TEXT PRIMARY KEY,
+    serial INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registrations_serial ON registrations (serial);
+"""
+
+
+def database_path() -> Path:
+    return programdirs.user_state_path.joinpath("inventory.db")
+
+
+def connect() -> sqlite3.Connection:
+    import sqlite3
+
+    path = database_path()
+    for parent in reversed(path.parents):
+        parent.mkdir(0o700, exist_ok=True)
+    if not path.exists():
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+    with span("inventory_connect"):
+        db = sqlite3.connect(path, timeout=10)
+        db.row_factory = sqlite3.Row
+        _ = db.execute("PRAGMA journal_mode=WAL")
+        _ = db.execute("PRAGMA synchronous=NORMAL")
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:  # pyright: ignore[reportAny]
+            with db:
+                _ = db.executescript(SCHEMA)
+                _ = db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    return db
+
+
+def normalize_fingerprint(fingerprint: str) -> str:
+    return fingerprint.replace(" ", "").upper()
+
+
+def record_device(db: sqlite3.Connection, info: DeviceInfo) -> None:
+    if info.serial is None:
+        return
+
+    _ = db.execute(
+        "INSERT INTO devices (serial, version, form_factor, seen_at) VALUES (?, ?, ?, ?)"
+        + " ON CONFLICT (serial) DO UPDATE SET version = excluded.version, form_factor = excluded.form_factor, seen_at = excluded.seen_at",
+        (info.serial, str(info.version), str(info.form_factor), time.time()),
+    )
+
+
+def touch_device(db: sqlite3.Connection, serial: int) -> None:
+    _ = db.execute(
+        "INSERT INTO devices (serial, seen_at) VALUES (?, ?) ON CONFLICT (serial) DO UPDATE SET seen_at = excluded.seen_at",
+        (serial, time.time()),
+    )
+
+
+def replace_ssh_keys(
+    db: sqlite3.Connection,
+    serial: int,
+    keys: Iterable[tuple[str, str, str | None, str | None, tuple[str, ...]]],
+) -> None:
+    now = time.time()
+
+    touch_device(db, serial)
+    _ = db.execute("DELETE FROM ssh_keys WHERE serial = ?", (serial,))
+    _ = db.execute("DELETE FROM ssh_hosts WHERE serial = ?", (serial,))
+    for file, application, public_key, fingerprint, hosts in keys:
+        _ = db.execute(
+            "INSERT INTO ssh_keys (serial, file, application, public_key, fingerprint, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (serial, file, application, public_key, fingerprint, now),
+        )
+        _ = db.executemany(
+            "INSERT OR IGNORE INTO ssh_hosts (serial, file, host) VALUES (?, ?, ?)", [(serial, file, host) for host in hosts]
+        )
+
+
+def record_pgp_transfer(
+    db: sqlite3.Connection,
+    serial: int,
+    fingerprint: str,
+    results: Mapping[str, bool],
+    subkeys: Mapping[str, str] | None = None,
+) -> None:
+    now = time.time()
+
+    touch_device(db, serial)
+    for slot, success in results.items():
+        if success:
+            subkey = None if subkeys is None or slot not in subkeys else normalize_fingerprint(subkeys[slot])
+            _ = db.execute(
+                "INSERT OR REPLACE INTO pgp_keys (serial, slot, fingerprint, subkey, transferred_at) VALUES (?, ?, ?, ?, ?)",
+                (serial, slot, normalize_fingerprint(fingerprint), subkey, now),
+            )
+
+
+def record_registration(db: sqlite3.Connection, name: str, serial: int) -> None:
+    touch_device(db, serial)
+    _ = db.execute("INSERT OR REPLACE INTO registrations (name, serial) VALUES (?, ?)", (name, serial))
+
+
+def remove_registration(db: sqlite3.Connection, name: str) -> None:
+    _ = db.execute("DELETE FROM registrations WHERE name = ?", (name,))
+
+
+def find_devices(db: sqlite3.Connection, serial: int | None = None) -> list[sqlite3.Row]:
+    return db.execute(
+        "SELECT d.serial, d.version, d.form_factor, d.seen_at, group_concat(r.name, ',') AS names FROM devices d"
+        + " LEFT JOIN registrations r ON r.serial = d.serial"
+        + (" WHERE d.serial = ?" if serial is not None else "")
+        + " GROUP BY d.serial ORDER BY d.serial",
+        () if serial is None else (serial,),
+    ).fetchall()
+
+
+def find_ssh_keys(
+    db: sqlite3.Connection,
+    host: str | None = None,
+    application: str | None = None,
+    fingerprint: str | None = None,
+    serial: int | None = None,
+) -> list[sqlite3.Row]:
+    conditions: list[str] = []
+    params: list[str | int] = []
+    if host is not None:
+        conditions.append("(k.serial, k.file) IN (SELECT h.serial, h.file FROM ssh_hosts h WHERE h.host = ?)")
+        params.append(host)
+    if application is not None:
+        conditions.append("k.application = ?")
+        params.append(application)
+    if fingerprint is not None:
+        conditions.append("k.fingerprint = ?")
+        params.append(fingerprint)
+    if serial is not None:
+        conditions.append("k.serial = ?")
+        params.append(serial)
+
+    return db.execute(
+        "SELECT k.serial, k.file, k.application, k.fingerprint,"
+        + " (SELECT group_concat(h.host, ',') FROM ssh_hosts h WHERE h.serial = k.serial AND h.file = k.file) AS hosts"
+        + " FROM ssh_keys k"
+        + ("" if len(conditions) < 1 else " WHERE " + " AND ".join(conditions))
+        + " ORDER BY k.serial, k.file",
+        params,
+    ).fetchall()
+
+
+def find_pgp_keys(db: sqlite3.Connection, fingerprint: str | None = None, serial: int | None = None) -> list[sqlite3.Row]:
+    conditions: list[str] = []
+    params: list[str | int] = []
+    if fingerprint is not None:
+        conditions.append("(fingerprint = ? OR subkey = ?)")
+        params.extend([normalize_fingerprint(fingerprint)] * 2)
+    if serial is not None:
+        conditions.append("serial = ?")
+        params.append(serial)
+
+    return db.execute(
+        "SELECT serial, slot, fingerprint, subkey, transferred_at FROM pgp_keys"
+        + ("" if len(conditions) < 1 else " WHERE " + " AND ".join(conditions))
+        + " ORDER BY serial, slot",
+        params,
+    ).fetchall()
+
+
+def open_inventory() -> closing[sqlite3.Connection]:
+    return closing(connect())
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, ClassVar, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from yubigen.events import emit
+from yubigen.pgp import gen_homedir_path, kill_gpg_component, setup_temporary_homedir
+from yubigen.trace import span
+
+DAY = 24 * 60 * 60
+EXPIRY_UNITS = {"d": DAY, "w": 7 * DAY, "m": 30 * DAY, "y": 365 * DAY}
+EXPIRY_PATTERN = re.compile(r"^(\d+)([dwmy]?)$")
+NEVER = "never"
+
+Usage = Literal["sign", "encrypt", "auth"]
+Expiry = int | Literal["never"]
+
+
+def parse_expiry(value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return NEVER if value == 0 else value
+    if not isinstance(value, str):
+        return value
+
+    if value.strip().lower() == NEVER:
+        return NEVER
+
+    match = EXPIRY_PATTERN.match(value.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid expiry '{value}', expected never or a number with a d, w, m or y suffix")
+
+    seconds = int(match[1]) * EXPIRY_UNITS.get(match[2], 1)
+    return NEVER if seconds == 0 else seconds
+
+
+def expiry_args(expires: Expiry) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+    return {"expires": False, "expires_in": 0} if expires == NEVER else {"expires": True, "expires_in": expires}
+
+
+class SubkeySpec(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    usage: Usage
+    algorithm: str | None = Field(default=None)
+    expires: Expiry | None = Field(default=None)
+
+    @field_validator("expires", mode="before")
+    @classmethod
+    def parse_expires(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        return parse_expiry(value)
+
+
+class KeyDefaults(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    algorithm: str = Field(default="ed25519")
+    expires: Expiry = Field(default=2 * EXPIRY_UNITS["y"])
+    subkeys: list[SubkeySpec] = Field(
+        default_factory=lambda: [SubkeySpec.model_validate({"usage": usage}) for usage in ["sign", "encrypt", "auth"]]
+    )
+
+    @field_validator("subkeys", mode="before")
+    @classmethod
+    def normalize_subkeys(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        if not isinstance(value, list):
+            return value
+
+        return [{"usage": subkey} if isinstance(subkey, str) else subkey for subkey in value]  # pyright: ignore[reportUnknownVariableType]
+
+    @field_validator("expires", mode="before")
+    @classmethod
+    def parse_expires(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        return parse_expiry(value)
+
+
+class KeySpec(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    uids: list[str] = Field(min_length=1)
+    name: str | None = Field(default=None)
+    algorithm: str | None = Field(default=None)
+    expires: Expiry | None = Field(default=None)
+    subkeys: list[SubkeySpec] | None = Field(default=None)
+    passphrase: str | None = Field(default=None)
+
+    @field_validator("subkeys", mode="before")
+    @classmethod
+    def normalize_subkeys(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        return KeyDefaults.normalize_subkeys(value)  # pyright: ignore[reportAny]
+
+    @field_validator("expires", mode="before")
+    @classmethod
+    def parse_expires(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        return parse_expiry(value)
+
+
+class KeyManifest(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    defaults: KeyDefaults = Field(default_factory=lambda: KeyDefaults.model_validate({}))
+    keys: list[KeySpec] = Field(min_length=1)
+
+    def resolve(self, spec: KeySpec) -> tuple[str, Expiry, list[SubkeySpec]]:
+        return (
+            spec.algorithm or self.defaults.algorithm,
+            self.defaults.expires if spec.expires is None else spec.expires,
+            self.defaults.subkeys if spec.subkeys is None else spec.subkeys,
+        )
+
+
+def parse_key_manifest(data: bytes, format: str | None = None) -> KeyManifest:
+    from tomllib import loads
+
+    if format is None:
+        format = "json" if data.lstrip().startswith(b"{") else "toml"
+
+    return KeyManifest.model_validate(json.loads(data) if format == "json" else loads(data.decode()))
+
+
+def read_key_manifest(path: Path) -> KeyManifest:
+    with open(path, "rb") as file:
+        return parse_key_manifest(file.read(), "toml" if path.suffix == ".toml" else "json" if path.suffix == ".json" else None)
+
+
+def subkey_algorithm(primary: str, subkey: SubkeySpec) -> str:
+    if subkey.algorithm is not None:
+        return subkey.algorithm
+    if subkey.usage == "encrypt" and primary == "ed25519":
+        return "cv25519"
+    if subkey.usage == "encrypt" and primary == "ed448":
+        return "cv448"
+
+    return primary
+
+
+def generate_key(manifest: KeyManifest, spec: KeySpec, homedir: Path) -> str:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    algorithm, expires, subkeys = manifest.resolve(spec)
+
+    setup_temporary_homedir(homedir, True)
+    try:
+        with gpg.Context(home_dir=bytes(homedir)) as ctx:
+            # Unprotected keys are created with NOPASSWD; loopback keeps any agent prompt away from pinentry
+            passphrase = spec.passphrase or ""
+            ctx.pinentry_mode = gpg.constants.PINENTRY_MODE_LOOPBACK  # pyright: ignore[reportAny]
+            ctx.set_passphrase_cb(lambda *args: passphrase)  # pyright: ignore[reportUnknownMemberType, reportUnknownLambdaType]
+
+            with span("gpg", kind="machine", operation="generate", uid=spec.uids[0]):
+                result = ctx.create_key(  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+                    spec.uids[0],
+                    algorithm=algorithm,
+                    certify=True,
+                    passphrase=spec.passphrase,
+                    **expiry_args(expires),
+                )
+            fingerprint = str(result.fpr)  # pyright: ignore[reportUnknownMemberType, reportUnknownArgumentType]
+            key = ctx.get_key(fingerprint, secret=True)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+
+            for uid in spec.uids[1:]:
+                ctx.key_add_uid(key, uid)  # pyright: ignore[reportUnknownMemberType]
+
+            for subkey in subkeys:
+                subkey_expires = expires if subkey.expires is None else subkey.expires
+                with span("gpg", kind="machine", operation="generate_subkey", key=fingerprint, usage=subkey.usage):
+                    _ = ctx.create_subkey(  # pyright: ignore[reportUnknownMemberType]
+                        key,
+                        algorithm=subkey_algorithm(algorithm, subkey),
+                        sign=subkey.usage == "sign",
+                        encrypt=subkey.usage == "encrypt",
+                        authenticate=subkey.usage == "auth",
+                        passphrase=spec.passphrase,
+                        **expiry_args(subkey_expires),
+                    )
+
+        return fingerprint
+    finally:
+        kill_gpg_component("gpg-agent", homedir)
+
+
+def merge_homedir(source: Path, target: Path, key_fingerprint: str) -> None:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    with gpg.Context(armor=True, home_dir=bytes(source)) as ctx:
+        data = gpg.Data()  # pyright: ignore[reportUnknownMemberType]
+        ctx.op_export(key_fingerprint, 0, data)  # pyright: ignore[reportUnknownMemberType]
+        _ = data.seek(0, os.SEEK_SET)  # pyright: ignore[reportUnknownMemberType]
+
+    with gpg.Context(home_dir=bytes(target)) as ctx:
+        ctx.op_import(data)  # pyright: ignore[reportUnknownMemberType]
+
+    private_keys = target.joinpath("private-keys-v1.d")
+    private_keys.mkdir(0o700, exist_ok=True)
+    for path in source.joinpath("private-keys-v1.d").glob("*.key"):
+        destination = private_keys.joinpath(f"{path.name}.new")
+        _ = shutil.copyfile(path, destination)
+        destination.chmod(0o600)
+        _ = shutil.move(destination, destination.with_name(path.name))
+
+
+def generate_keys(manifest: KeyManifest, jobs: int = 1) -> list[tuple[KeySpec, str | Exception]]:
+    from gpg.errors import GPGMEError  # pyright: ignore[reportMissingTypeStubs]
+
+    homedir = gen_homedir_path()
+    setup_temporary_homedir(homedir, True)
+
+    batch_home = homedir.with_name(f"{homedir.name}-batch")
+
+    def job(index: int, spec: KeySpec) -> str:
+        work = batch_home.joinpath(str(index))
+        shutil.rmtree(work, ignore_errors=True)
+        try:
+            return generate_key(manifest, spec, work)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+
+    results: list[tuple[KeySpec, str | Exception]] = []
+    with ThreadPoolExecutor(jobs, "yubigen-keygen") as executor:
+        futures = [(index, spec, executor.submit(job, index, spec)) for index, spec in enumerate(manifest.keys)]
+        for index, spec, future in futures:
+            error = future.exception()
+            if error is not None and not isinstance(error, Exception):
+                raise error
+            if error is not None:
+                emit("error", name=spec.name, uid=spec.uids[0], error=f"{type(error).__name__}: {error}")
+                results.append((spec, error))
+                continue
+
+            fingerprint = future.result()
+            try:
+                with span("merge_homedir", key=fingerprint):
+                    merge_homedir(batch_home.joinpath(str(index)), homedir, fingerprint)
+            except (OSError, GPGMEError) as e:
+                emit("error", name=spec.name, uid=spec.uids[0], key=fingerprint, error=f"{type(e).__name__}: {e}")
+                results.append((spec, e))
+            else:
+                emit("key_created", name=spec.name, uid=spec.uids[0], key=fingerprint)
+                results.append((spec, fingerprint))
+            finally:
+                shutil.rmtree(batch_home.joinpath(str(index)), ignore_errors=True)
+
+    shutil.rmtree(batch_home, ignore_errors=True)
+    return results
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import fcntl
+import os
+import random
+import threading
+import time
+from collections.abc import AsyncGenerator, Callable, Generator, Iterable
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from hashlib import sha256
+from pathlib import Path
+from typing import TypeVar
+
+from yubigen.trace import span
+
+T = TypeVar("T")
+
+LOCK_TIMEOUT = 120.0
+RETRY_ATTEMPTS = 6
+RETRY_BASE = 0.1
+RETRY_CAP = 2.0
+
+BUSY_ERRNOS = {errno.EBUSY, errno.EAGAIN}
+BUSY_MESSAGES = ["sharing violation", "in use", "busy", "reset card"]
+
+
+class DeviceBusyError(TimeoutError):
+    pass
+
+
+def backoff(attempt: int, base: float = RETRY_BASE, cap: float = RETRY_CAP) -> float:
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def is_busy(error: BaseException) -> bool:
+    if isinstance(error, OSError) and error.errno in BUSY_ERRNOS:
+        return True
+
+    message = str(error).lower()
+    return type(error).__name__ == "CardConnectionException" or any(text in message for text in BUSY_MESSAGES)
+
+
+def retry_busy(fn: Callable[[], T], label: str, attempts: int = RETRY_ATTEMPTS) -> T:
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            attempt += 1
+            if attempt >= attempts or not is_busy(e):
+                raise
+
+            delay = backoff(attempt)
+            with span("busy_retry", target=label, attempt=attempt, delay=delay, error=f"{type(e).__name__}: {e}"):
+                time.sleep(delay)
+
+
+class DeviceLock:
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self.lock: threading.Lock = threading.Lock()
+        self.holders: int = 0
+        self.fd: int | None = None
+
+    def acquire(self, timeout: float = LOCK_TIMEOUT) -> None:
+        with self.lock:
+            if self.holders == 0:
+                self.fd = self.lock_file(time.monotonic() + timeout)
+            self.holders += 1
+
+    async def acquire_async(self, timeout: float = LOCK_TIMEOUT) -> None:
+        guard = threading.Lock()
+        acquired = abandoned = False
+
+        def acquire() -> None:
+            nonlocal acquired
+            self.acquire(timeout)
+            with guard:
+                if abandoned:
+                    self.release()
+                else:
+                    acquired = True
+
+        try:
+            await asyncio.to_thread(acquire)
+        except asyncio.CancelledError:
+            # The worker thread cannot be interrupted, whichever side finishes last gives the lock back
+            with guard:
+                abandoned = True
+                if acquired:
+                    self.release()
+            raise
+
+    def lock_file(self, deadline: float) -> int:
+        for parent in reversed(self.path.parents):
+            parent.mkdir(0o700, exist_ok=True)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        try:
+            attempt = 0
+            with span("lock_wait", lock=self.path.stem) as trace_args:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise DeviceBusyError(f"Timed out waiting for {self.path.stem}, another process is using it") from None
+
+                        attempt += 1
+                        trace_args["attempts"] = attempt
+                        time.sleep(min(remaining, backoff(min(attempt, 8), cap=0.5)))
+
+            _ = os.ftruncate(fd, 0)
+            _ = os.write(fd, f"{os.getpid()}\n".encode())
+            return fd
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def release(self) -> None:
+        with self.lock:
+            self.holders -= 1
+            if self.holders == 0 and self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+                os.close(self.fd)
+                self.fd = None
+
+
+class LockManager:
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.locks: dict[str, DeviceLock] = {}
+
+    def get(self, name: str) -> DeviceLock:
+        from yubigen.core import programdirs
+
+        with self.lock:
+            if name not in self.locks:
+                self.locks[name] = DeviceLock(programdirs.user_runtime_path.joinpath("locks", f"{name}.lock"))
+
+            return self.locks[name]
+
+    @contextmanager
+    def hold(self, names: Iterable[str], timeout: float = LOCK_TIMEOUT) -> Generator[None, None, None]:
+        with ExitStack() as stack:
+            for name in sorted(set(names)):
+                device_lock = self.get(name)
+                device_lock.acquire(timeout)
+                _ = stack.callback(device_lock.release)
+
+            yield
+
+    @asynccontextmanager
+    async def hold_async(self, names: Iterable[str], timeout: float = LOCK_TIMEOUT) -> AsyncGenerator[None, None]:
+        acquired: list[DeviceLock] = []
+        try:
+            for name in sorted(set(names)):
+                device_lock = self.get(name)
+                await device_lock.acquire_async(timeout)
+                acquired.append(device_lock)
+
+            yield
+        finally:
+            for device_lock in reversed(acquired):
+                device_lock.release()
+
+
+lock_manager = LockManager()
+
+
+def device_lock_names(fingerprint: str, serial: int | None = None) -> list[str]:
+    name = f"device-{sha256(fingerprint.encode()).hexdigest()[:16]}"
+    return [name] if serial is None else [str(serial), name]
+
+
+def device_lock(*serials: int | None, timeout: float = LOCK_TIMEOUT):
+    return lock_manager.hold((str(serial) for serial in serials if serial is not None), timeout)
+
+
+def device_lock_async(*serials: int | None, timeout: float = LOCK_TIMEOUT):
+    return lock_manager.hold_async((str(serial) for serial in serials if serial is not None), timeout)
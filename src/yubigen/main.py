@@ -1,21 +1,90 @@
 #!/usr/bin/env python3
 
+from pathlib import Path
+
 import click
 
-from yubigen.cli.pgp import pgp
-from yubigen.cli.setup import setup
-from yubigen.cli.ssh import ssh
+from yubigen.cli.lazy import LazyGroup
+from yubigen.events import emit, emitter
+from yubigen.trace import tracer
 
 
-@click.group(help="Credential management helper for YubiKeys")
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "daemon": "yubigen.cli.daemon:daemon",
+        "inventory": "yubigen.cli.inventory:inventory",
+        "pgp": "yubigen.cli.pgp:pgp",
+        "setup": "yubigen.cli.setup:setup",
+        "ssh": "yubigen.cli.ssh:ssh",
+        "u2f": "yubigen.cli.u2f:u2f",
+    },
+    help="Credential management helper for YubiKeys",
+)
 @click.version_option()
-def main():
-    pass
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Record timing spans to this file",
+)
+@click.option(
+    "--trace-format",
+    type=click.Choice(["chrome", "jsonl"]),
+    help="Trace file format (jsonl for .jsonl files and chrome otherwise by default)",
+)
+@click.option(
+    "--output",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    envvar="YUBIGEN_OUTPUT",
+    help="Report progress as human text or as one JSON event per line on stdout",
+)
+@click.option("--serial", "serials", type=int, multiple=True, help="Only operate on the YubiKey with this serial number")
+@click.option(
+    "--device",
+    "devices",
+    type=click.Path(exists=True, dir_okay=False, readable=False, resolve_path=True, path_type=Path),
+    multiple=True,
+    help="Only operate on the YubiKey at this hidraw device path",
+)
+@click.option(
+    "--backend",
+    type=str,
+    default="usb",
+    envvar="YUBIGEN_BACKEND",
+    help="Device backend, usb for plugged-in YubiKeys or sim:COUNT for simulated ones",
+)
+@click.pass_context
+def main(
+    ctx: click.Context,
+    trace: Path | None,
+    trace_format: str | None,
+    output: str,
+    serials: tuple[int, ...],
+    devices: tuple[Path, ...],
+    backend: str,
+):
+    if output == "json":
+        emitter.configure()
+        emit("started", command=ctx.invoked_subcommand)
+
+    if trace is not None:
+        tracer.configure(trace, trace_format)
+        _ = ctx.call_on_close(tracer.write)
+
+    if backend != "usb":
+        from yubigen.core import select_backend
+
+        try:
+            select_backend(backend)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--backend") from None
+
+    if len(serials) > 0 or len(devices) > 0:
+        from yubigen.core import select_devices
 
+        select_devices(serials, devices)
 
-main.add_command(pgp)
-main.add_command(setup)
-main.add_command(ssh)
 
 if __name__ == "__main__":
     main()
@@ -1,39 +1,112 @@
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractContextManager
+from functools import cached_property
 from pathlib import Path
-from typing import Generic, TypeVar, cast, override
+from typing import TYPE_CHECKING, Generic, TypeVar, cast, override
+
+from yubigen.core import (
+    DeviceSelector,
+    capability_enabled,
+    iter_devices,
+    list_devices,
+    programdirs,
+    run_devices,
+    run_devices_async,
+    session_pool,
+)
+from yubigen.locks import retry_busy
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    from ykman.base import YkmanDevice
+    from yubikit.core import TRANSPORT, Connection
+    from yubikit.core.fido import FidoConnection
+    from yubikit.core.smartcard import SmartCardConnection
+    from yubikit.management import CAPABILITY, DeviceInfo
+
+
+T = TypeVar("T", bound="Connection | FidoConnection")
+S = TypeVar("S")
 
-from ykman.base import YkmanDevice
-from yubikit.core import TRANSPORT, Connection
-from yubikit.core.fido import FidoConnection
-from yubikit.management import CAPABILITY, DeviceInfo
 
-from yubigen.core import capability_enabled, iter_devices, list_devices, programdirs
+def fido_connection() -> type[FidoConnection]:
+    from yubikit.core.fido import FidoConnection
 
+    return FidoConnection
 
-T = TypeVar("T", bound=Connection | FidoConnection)
+
+def smartcard_connection() -> type[SmartCardConnection]:
+    from yubikit.core.smartcard import SmartCardConnection
+
+    return SmartCardConnection
 
 
 class Module(Generic[T]):
     def __init__(
         self,
         label: str,
-        connection: type[T],
-        capability: CAPABILITY,
+        connection: Callable[[], type[T]],
+        capability: str,
     ) -> None:
         self.label: str = label
-        self.connection: type[T] = connection
-        self.capability: CAPABILITY = capability
+        self.load_connection: Callable[[], type[T]] = connection
+        self.capability_name: str = capability
+
+    @cached_property
+    def connection(self) -> type[T]:
+        return self.load_connection()
+
+    @cached_property
+    def capability(self) -> CAPABILITY:
+        from yubikit.management import CAPABILITY
 
-    def list_devices(self):
-        return list_devices(self.connection)
+        return CAPABILITY[self.capability_name]
 
-    def iter_devices(self, /, abort: bool = False, quiet: bool = False):
-        return iter_devices(self.connection, self.capability, abort=abort, quiet=quiet)
+    def list_devices(self, selector: DeviceSelector | None = None):
+        return list_devices(self.connection, selector=selector)
+
+    def iter_devices(self, /, abort: bool = False, quiet: bool = False, selector: DeviceSelector | None = None):
+        return iter_devices(self.connection, self.capability, abort=abort, quiet=quiet, selector=selector)
+
+    def run_devices(
+        self,
+        fn: Callable[[YkmanDevice, DeviceInfo], None],
+        /,
+        jobs: int = 1,
+        abort: bool = False,
+        quiet: bool = False,
+    ):
+        return run_devices(fn, self.iter_devices(abort, quiet), jobs=jobs)
+
+    async def run_devices_async(
+        self,
+        fn: Callable[[YkmanDevice, DeviceInfo], Awaitable[None]],
+        /,
+        jobs: int = 1,
+        abort: bool = False,
+        quiet: bool = False,
+    ):
+        return await run_devices_async(fn, self.iter_devices(abort, quiet), jobs=jobs)
 
     def capability_enabled(self, device_or_transport: YkmanDevice | TRANSPORT, info: DeviceInfo):
         return capability_enabled(self.capability, device_or_transport, info)
 
     def open_connection(self, device: YkmanDevice) -> T:
-        return cast(T, device.open_connection(cast(type[Connection], self.connection)))
+        from yubikit.core import Connection
+
+        with span("open_connection", module=self.label, device=str(device.fingerprint)):
+            return cast(T, retry_busy(lambda: device.open_connection(cast(type[Connection], self.connection)), str(device.fingerprint)))
+
+    def acquire(self, device: YkmanDevice, info: DeviceInfo) -> AbstractContextManager[T]:
+        return session_pool.connection(device, info, self.connection)
+
+    def session(self, device: YkmanDevice, info: DeviceInfo, factory: Callable[[T], S]) -> AbstractContextManager[S]:
+        return session_pool.session(device, info, self.connection, factory)
+
+    def release(self, serial: int | None = None) -> None:
+        session_pool.release(serial, self.connection)
 
     @property
     def basename(self) -> str:
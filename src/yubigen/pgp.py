@@ -1,21 +1,31 @@
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import time
 from collections import deque
 from collections.abc import Iterable, Iterator
-from os import getenv
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import shutil
-import subprocess
-from typing import Any
+from typing import TYPE_CHECKING, Any, BinaryIO, cast
 
 from click.termui import confirm, secho
 from click.utils import echo
-import gpg  # pyright: ignore[reportMissingTypeStubs]
-from gpg.errors import KeyNotFound  # pyright: ignore[reportMissingTypeStubs]
-from yubikit.core.smartcard import SmartCardConnection
-from yubikit.management import CAPABILITY
-from yubigen.module import Module
 
+from yubigen.core import job_errors
+from yubigen.events import emit
+from yubigen.locks import device_lock, lock_manager
+from yubigen.module import Module, smartcard_connection
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    from yubikit.management import DeviceInfo
 
-MODULE = Module("PGP", SmartCardConnection, CAPABILITY.OPENPGP)
+
+MODULE = Module("PGP", smartcard_connection, "OPENPGP")
 
 
 class GpgTransferInteraction:
@@ -24,6 +34,9 @@ class GpgTransferInteraction:
 
     def __init__(self, subkeys: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
         self.subkeys: Any = subkeys  # pyright: ignore[reportExplicitAny]
+        self.results: dict[str, bool] = {}
+        self.fingerprints: dict[str, str] = {}
+        self.pending: str | None = None
 
     def get_subkey(self) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
         return self.subkeys[self.current]  # pyright: ignore[reportAny]
@@ -40,13 +53,24 @@ class GpgTransferInteraction:
 
     def complete(self) -> None:
         self.completed = True
+        self.pending = self.get_slot()
+        if self.pending is not None:
+            self.fingerprints[self.pending] = str(self.get_subkey().fpr)  # pyright: ignore[reportAny]
+
+    def record(self, success: bool) -> None:
+        if self.pending is not None:
+            self.results[self.pending] = success
+            self.pending = None
 
     def interact_callback(self, keyword: str, args: str) -> str | None:
+        if keyword in ["SC_OP_FAILURE", "ERROR"]:
+            self.record(False)
         if keyword == "GET_LINE":
             if args == "cardedit.genkeys.storekeytype":
                 return self.get_slot()
             if args == "keyedit.prompt":
                 if self.completed:
+                    self.record(True)
                     try:
                         return f"key {next(self)}"
                     except StopIteration:
@@ -84,15 +108,40 @@ def gen_homedir_path() -> Path:
     return MODULE.runtime_home.joinpath("gnupg")
 
 
+def original_homedir_path() -> Path:
+    original = os.getenv("GNUPGHOME", Path.home().joinpath(".gnupg"))
+    if isinstance(original, str):
+        original = Path(original)
+
+    return original
+
+
+def pin_reader(homedir: Path, reader: str | None) -> None:
+    path = homedir.joinpath("scdaemon.conf.new")
+    original = original_homedir_path().joinpath("scdaemon.conf")
+
+    if reader is None:
+        path.symlink_to(original)
+    else:
+        try:
+            lines = [line for line in original.read_text().splitlines() if not line.strip().startswith("reader-port")]
+        except FileNotFoundError:
+            lines = []
+        lines.append(f"reader-port {reader}")
+
+        with open(path, "w", opener=lambda file, flags: os.open(file, flags, 0o600)) as file:
+            file.writelines(f"{line}\n" for line in lines)
+
+    _ = shutil.move(path, path.with_name("scdaemon.conf"))
+
+
 def setup_temporary_homedir(dir: Path, create: bool = False) -> None:
     if create:
         for parent in reversed(dir.parents):
             parent.mkdir(0o700, exist_ok=True)
         dir.mkdir(0o700, exist_ok=True)
 
-    original = getenv("GNUPGHOME", Path.home().joinpath(".gnupg"))
-    if isinstance(original, str):
-        original = Path(original)
+    original = original_homedir_path()
 
     for filename in ["gpg.conf", "gpg-agent.conf", "scdaemon.conf"]:
         path = dir.joinpath(f"{filename}.new")
@@ -115,7 +164,20 @@ def build_gpg_args(
     return call
 
 
-def interact_gpg_transfer(key_fingerprint: str, homedir: Path | None = None) -> None:
+def homedir_lock(homedir: Path):
+    return lock_manager.hold([f"gnupg-{homedir.name}"])
+
+
+def kill_gpg_component(component: str, homedir: Path | None = None) -> None:
+    with span("gpgconf", component=component):
+        _ = subprocess.run(build_gpg_args(["--kill", component], homedir, bin="gpgconf"))
+
+
+def interact_gpg_transfer(key_fingerprint: str, homedir: Path | None = None, serial: int | None = None) -> dict[str, bool]:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    from yubigen import inventory
+
     with gpg.Context(home_dir=None if homedir is None else bytes(homedir)) as ctx:
         key = ctx.get_key(key_fingerprint)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
 
@@ -123,61 +185,217 @@ def interact_gpg_transfer(key_fingerprint: str, homedir: Path | None = None) ->
 
         ctx.interact(key, interaction.interact_callback)  # pyright: ignore[reportUnknownArgumentType, reportUnknownMemberType]
 
+    if serial is not None:
+        with inventory.open_inventory() as db, db:
+            inventory.record_pgp_transfer(db, serial, key_fingerprint, interaction.results, interaction.fingerprints)
+
+    emit("key_transferred", serial, key=key_fingerprint, slots=interaction.results)
+
+    return interaction.results
+
+
+def secret_fingerprints(homedir: Path) -> list[str]:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    with gpg.Context(home_dir=bytes(homedir)) as ctx:
+        return [str(key.fpr) for key in ctx.keylist(secret=True)]  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType, reportUnknownArgumentType]
+
 
 def create_key(full: bool = True, expert: bool = False) -> str:
     homedir = gen_homedir_path()
     setup_temporary_homedir(homedir, True)
 
-    args = ["--full-generate-key" if full else "--generate-key", "--with-colons"]
+    args = ["--full-generate-key" if full else "--generate-key"]
     if expert:
         args.append("--expert")
 
-    result = subprocess.run(build_gpg_args(args, homedir), stdout=subprocess.PIPE)
-    key = result.stdout.partition(b"\n")[0].split(b":")[4].decode()
+    existing = secret_fingerprints(homedir)
+    with span("gpg", kind="interactive", operation="generate"):
+        _ = subprocess.run(build_gpg_args(args, homedir))
+    created = [fingerprint for fingerprint in secret_fingerprints(homedir) if fingerprint not in existing]
+    if len(created) < 1:
+        secho("No key was created.", err=True, fg="red")
+        exit(1)
+
+    return created[0]
+
+
+def export_modes() -> dict[str, int]:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    return {
+        "public.asc": 0,
+        "secret.asc": gpg.constants.EXPORT_MODE_SECRET,  # pyright: ignore[reportAny]
+        "secret_sub.asc": gpg.constants.EXPORT_MODE_SECRET | gpg.constants.EXPORT_MODE_SECRET_SUBKEY,  # pyright: ignore[reportAny]
+    }
+
+
+def export_keys(key_fingerprints: Iterable[str], homedir: Path | None = None) -> list[Path]:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+    from gpg.errors import KeyNotFound  # pyright: ignore[reportMissingTypeStubs]
+
+    if homedir is None:
+        homedir = gen_homedir_path()
 
-    return key
+    exports = export_modes()
+
+    dirs: list[Path] = []
+    with gpg.Context(armor=True, home_dir=bytes(homedir)) as ctx:
+        for key_fingerprint in key_fingerprints:
+            try:
+                _ = ctx.get_key(key_fingerprint, secret=True)  # pyright: ignore[reportUnknownMemberType]
+            except KeyNotFound:
+                secho(f"Key '{key_fingerprint}' not found.", err=True, fg="red")
+                exit(1)
+
+            dir = MODULE.runtime_home.joinpath(key_fingerprint)
+            for parent in reversed(dir.parents):
+                parent.mkdir(0o700, exist_ok=True)
+            dir.mkdir(0o700, exist_ok=True)
+
+            for filename, mode in exports.items():
+                with (
+                    span("export", key=key_fingerprint, file=filename),
+                    open(dir.joinpath(filename), "wb", opener=lambda file, flags: os.open(file, flags, 0o600)) as file,
+                ):
+                    ctx.op_export(key_fingerprint, mode, file)  # pyright: ignore[reportUnknownMemberType]
+
+            echo(f"Key exported at {str(dir)}")
+            dirs.append(dir)
+
+    return dirs
 
 
 def export_key(key_fingerprint: str) -> None:
-    dir = MODULE.runtime_home.joinpath(key_fingerprint)
-    for parent in reversed(dir.parents):
-        parent.mkdir(0o700, exist_ok=True)
-    dir.mkdir(0o700, exist_ok=True)
-
-    _ = subprocess.run(
-        build_gpg_args(
-            ["--armor", "--output", str(dir.joinpath("public.asc")), "--export", key_fingerprint],
-            gen_homedir_path(),
-        )
-    )
-    _ = subprocess.run(
-        build_gpg_args(
-            ["--armor", "--output", str(dir.joinpath("secret.asc")), "--export-secret-keys", key_fingerprint],
-            gen_homedir_path(),
-        )
-    )
-    _ = subprocess.run(
-        build_gpg_args(
-            ["--armor", "--output", str(dir.joinpath("secret_sub.asc")), "--export-secret-subkeys", key_fingerprint],
-            gen_homedir_path(),
-        )
-    )
-
-    echo(f"Key exported at {str(dir)}")
+    _ = export_keys([key_fingerprint])
+
+
+def write_archive(pipe: BinaryIO, key_fingerprints: Iterable[str], homedir: Path) -> None:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+
+    exports = export_modes()
+    with tarfile.open(fileobj=pipe, mode="w|", format=tarfile.PAX_FORMAT) as tar, gpg.Context(armor=True, home_dir=bytes(homedir)) as ctx:
+        for key_fingerprint in key_fingerprints:
+            for filename, mode in exports.items():
+                with span("export", key=key_fingerprint, file=filename, archive=True):
+                    data = gpg.Data()  # pyright: ignore[reportUnknownMemberType]
+                    ctx.op_export(key_fingerprint, mode, data)  # pyright: ignore[reportUnknownMemberType]
+                    _ = data.seek(0, os.SEEK_SET)  # pyright: ignore[reportUnknownMemberType]
+                    content = cast(bytes, data.read())  # pyright: ignore[reportUnknownMemberType]
+
+                info = tarfile.TarInfo(f"{key_fingerprint}/{filename}")
+                info.size = len(content)
+                info.mode = 0o600
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(content))
+
+
+def export_archive(
+    key_fingerprints: Iterable[str],
+    output: BinaryIO,
+    passphrase: str | None = None,
+    armor: bool = False,
+    homedir: Path | None = None,
+) -> None:
+    import gpg  # pyright: ignore[reportMissingTypeStubs]
+    from gpg.errors import KeyNotFound  # pyright: ignore[reportMissingTypeStubs]
+
+    if homedir is None:
+        homedir = gen_homedir_path()
+
+    key_fingerprints = list(key_fingerprints)
+    with gpg.Context(armor=armor, home_dir=bytes(homedir)) as ctx:
+        for key_fingerprint in key_fingerprints:
+            try:
+                _ = ctx.get_key(key_fingerprint, secret=True)  # pyright: ignore[reportUnknownMemberType]
+            except KeyNotFound:
+                secho(f"Key '{key_fingerprint}' not found.", err=True, fg="red")
+                exit(1)
+
+        if passphrase is not None:
+            ctx.pinentry_mode = gpg.constants.PINENTRY_MODE_LOOPBACK  # pyright: ignore[reportAny]
+
+        read_fd, write_fd = os.pipe()
+
+        def produce() -> None:
+            with os.fdopen(write_fd, "wb") as pipe:
+                write_archive(pipe, key_fingerprints, homedir)
+
+        with (
+            ThreadPoolExecutor(1, "yubigen-archive") as executor,
+            span("export_archive", keys=len(key_fingerprints)),
+            os.fdopen(read_fd, "rb") as pipe,
+        ):
+            producer = executor.submit(produce)
+            try:
+                _ = ctx.encrypt(pipe, recipients=None, sign=False, sink=output, passphrase=passphrase)  # pyright: ignore[reportUnknownMemberType]
+            finally:
+                pipe.close()
+
+    producer.result()
+
+    emit("archive_written", keys=key_fingerprints, armor=armor)
 
 
 def transfer_key(key_fingerprint: str) -> None:
+    from gpg.errors import KeyNotFound  # pyright: ignore[reportMissingTypeStubs]
+
     homedir = gen_homedir_path()
     for file in homedir.glob("reader_"):
         file.unlink(missing_ok=True)
 
-    _ = subprocess.run(build_gpg_args(["--kill", "gpg-agent"], bin="gpgconf"))
-    try:
-        interact_gpg_transfer(key_fingerprint, homedir)
-    except KeyNotFound:
-        secho(f"Key '{key_fingerprint}' not found.", err=True, fg="red")
-        exit(1)
-    _ = subprocess.run(build_gpg_args(["--kill", "gpg-agent"], homedir, bin="gpgconf"))
+    device_list = list(MODULE.iter_devices(quiet=True))
+    serial = device_list[0][1].serial if len(device_list) == 1 else None
+
+    MODULE.release()
+    with homedir_lock(homedir), device_lock(*(info.serial for _, info in device_list)):
+        kill_gpg_component("gpg-agent")
+        try:
+            with span("transfer", serial, "interactive", key=key_fingerprint):
+                _ = interact_gpg_transfer(key_fingerprint, homedir, serial)
+        except KeyNotFound:
+            secho(f"Key '{key_fingerprint}' not found.", err=True, fg="red")
+            exit(1)
+        kill_gpg_component("gpg-agent", homedir)
+
+
+def transfer_key_batch(key_fingerprint: str) -> list[tuple[DeviceInfo, dict[str, bool] | Exception]]:
+    from gpg.errors import GPGMEError, KeyNotFound  # pyright: ignore[reportMissingTypeStubs]
+
+    homedir = gen_homedir_path()
+    for file in homedir.glob("reader_"):
+        file.unlink(missing_ok=True)
+
+    device_list = list(MODULE.iter_devices(True))
+
+    results: list[tuple[DeviceInfo, dict[str, bool] | Exception]] = []
+    MODULE.release()
+    with homedir_lock(homedir):
+        kill_gpg_component("gpg-agent")
+        try:
+            for device, info in device_list:
+                echo(f"\nTransferring to SN {info.serial}...")
+
+                try:
+                    with device_lock(info.serial), span("transfer", info.serial, "interactive", key=key_fingerprint):
+                        pin_reader(homedir, str(device.fingerprint))
+                        kill_gpg_component("scdaemon", homedir)
+                        try:
+                            results.append((info, interact_gpg_transfer(key_fingerprint, homedir, info.serial)))
+                        finally:
+                            kill_gpg_component("scdaemon", homedir)
+                except KeyNotFound:
+                    secho(f"Key '{key_fingerprint}' not found.", err=True, fg="red")
+                    exit(1)
+                except (*job_errors(), GPGMEError) as e:
+                    secho(f"Failed: {e}", err=True, fg="red")
+                    emit("error", info.serial, key=key_fingerprint, error=f"{type(e).__name__}: {e}")
+                    results.append((info, e))
+        finally:
+            pin_reader(homedir, None)
+            kill_gpg_component("gpg-agent", homedir)
+
+    return results
 
 
 def purge_keys() -> None:
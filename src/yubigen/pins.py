@@ -0,0 +1,96 @@
+import json
+import os
+import shlex
+import subprocess
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, ClassVar
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from yubigen.trace import span
+
+
+class FidoPins(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    pin: str | None = Field(default=None)
+    new_pin: str | None = Field(default=None)
+
+
+class OpenPgpPins(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    pin: str | None = Field(default=None)
+    new_pin: str | None = Field(default=None)
+    admin_pin: str | None = Field(default=None)
+    new_admin_pin: str | None = Field(default=None)
+
+
+class DevicePins(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    fido: FidoPins = Field(default_factory=lambda: FidoPins.model_validate({}))
+    openpgp: OpenPgpPins = Field(default_factory=lambda: OpenPgpPins.model_validate({}))
+
+
+class PinManifest(BaseModel):
+    model_config: ClassVar[ConfigDict] = ConfigDict(strict=True)
+
+    default: DevicePins = Field(default_factory=lambda: DevicePins.model_validate({}))
+    devices: Mapping[int, DevicePins] = Field(default_factory=lambda: {})
+
+    @field_validator("devices", mode="before")
+    @classmethod
+    def normalize_devices(cls, value: Any) -> Any:  # pyright: ignore[reportAny, reportExplicitAny]
+        if not isinstance(value, Mapping):
+            return value
+
+        return {int(serial) if isinstance(serial, str) and serial.isdigit() else serial: pins for serial, pins in value.items()}  # pyright: ignore[reportUnknownVariableType]
+
+    def lookup(self, serial: int, application: str, name: str) -> str | None:
+        for pins in [self.devices.get(serial), self.default]:
+            value = None if pins is None else getattr(getattr(pins, application), name)  # pyright: ignore[reportAny]
+            if value is not None:
+                return str(value)  # pyright: ignore[reportAny]
+
+
+def parse_manifest(data: bytes, format: str | None = None) -> PinManifest:
+    from tomllib import loads
+
+    if format is None:
+        format = "json" if data.lstrip().startswith(b"{") else "toml"
+
+    return PinManifest.model_validate(json.loads(data) if format == "json" else loads(data.decode()))
+
+
+def read_manifest_file(path: Path) -> PinManifest:
+    with open(path, "rb") as file:
+        return parse_manifest(file.read(), "toml" if path.suffix == ".toml" else "json" if path.suffix == ".json" else None)
+
+
+def read_manifest_fd(fd: int) -> PinManifest:
+    with os.fdopen(fd, "rb") as file:
+        return parse_manifest(file.read())
+
+
+class PinSource:
+    def __init__(self, manifest: PinManifest | None = None, command: str | None = None) -> None:
+        self.manifest: PinManifest | None = manifest
+        self.command: str | None = command
+
+    def get(self, serial: int, application: str, name: str) -> str | None:
+        if self.manifest is not None:
+            value = self.manifest.lookup(serial, application, name)
+            if value is not None:
+                return value
+
+        if self.command is not None:
+            env = dict(os.environ)
+            env["YUBIGEN_SERIAL"] = str(serial)
+            env["YUBIGEN_PIN"] = f"{application}.{name}"
+
+            with span("pin_command", serial, pin=env["YUBIGEN_PIN"]):
+                result = subprocess.run(shlex.split(self.command), env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+            if result.returncode == 0 and len(value := result.stdout.rstrip("\n")) > 0:
+                return value
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import subprocess
+import sys
+from collections.abc import Awaitable, Callable, Mapping, Sequence
+from typing import IO
+
+OutputCallback = Callable[[bytes], None]
+
+
+async def read_stream(stream: asyncio.StreamReader, buffer: bytearray, callback: OutputCallback | None) -> None:
+    while chunk := await stream.read(4096):
+        buffer.extend(chunk)
+        if callback is not None:
+            callback(chunk)
+
+
+async def stop_process(process: asyncio.subprocess.Process, grace: float = 2.0) -> None:
+    if process.returncode is not None:
+        return
+
+    try:
+        process.terminate()
+        _ = await asyncio.wait_for(asyncio.shield(process.wait()), grace)
+    except ProcessLookupError:
+        pass
+    except TimeoutError:
+        process.kill()
+        _ = await process.wait()
+
+
+async def run_process(
+    args: Sequence[str],
+    /,
+    cwd: str | os.PathLike[str] | None = None,
+    env: Mapping[str, str] | None = None,
+    stdin: int | None = None,
+    timeout: float | None = None,
+    check: bool = False,
+    capture_output: bool = False,
+    stdout: OutputCallback | None = None,
+    stderr: OutputCallback | None = None,
+) -> subprocess.CompletedProcess[bytes]:
+    capture_stdout = capture_output or stdout is not None
+    capture_stderr = capture_output or stderr is not None
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        env=env,
+        stdin=stdin,
+        stdout=subprocess.PIPE if capture_stdout else None,
+        stderr=subprocess.PIPE if capture_stderr else None,
+    )
+
+    stdout_buffer = bytearray()
+    stderr_buffer = bytearray()
+    readers: list[asyncio.Future[None]] = []
+    if process.stdout is not None:
+        readers.append(asyncio.ensure_future(read_stream(process.stdout, stdout_buffer, stdout)))
+    if process.stderr is not None:
+        readers.append(asyncio.ensure_future(read_stream(process.stderr, stderr_buffer, stderr)))
+
+    try:
+        waiters: list[Awaitable[object]] = [*readers, process.wait()]
+        _ = await asyncio.wait_for(asyncio.gather(*waiters), timeout)
+    except TimeoutError:
+        await stop_process(process)
+        raise subprocess.TimeoutExpired(list(args), timeout or 0, bytes(stdout_buffer), bytes(stderr_buffer)) from None
+    except asyncio.CancelledError:
+        await stop_process(process)
+        raise
+    finally:
+        for reader in readers:
+            _ = reader.cancel()
+
+    result = subprocess.CompletedProcess(
+        list(args),
+        process.returncode if process.returncode is not None else -1,
+        bytes(stdout_buffer) if capture_stdout else None,
+        bytes(stderr_buffer) if capture_stderr else None,
+    )
+    if check:
+        result.check_returncode()
+
+    return result
+
+
+class ProcessRunner:
+    def __init__(self, limit: int = 1, timeout: float | None = None) -> None:
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(limit)
+        self.timeout: float | None = timeout
+
+    async def run(
+        self,
+        args: Sequence[str],
+        /,
+        cwd: str | os.PathLike[str] | None = None,
+        env: Mapping[str, str] | None = None,
+        stdin: int | None = None,
+        check: bool = False,
+        capture_output: bool = False,
+        stdout: OutputCallback | None = None,
+        stderr: OutputCallback | None = None,
+    ) -> subprocess.CompletedProcess[bytes]:
+        async with self.semaphore:
+            return await run_process(
+                args,
+                cwd=cwd,
+                env=env,
+                stdin=stdin,
+                timeout=self.timeout,
+                check=check,
+                capture_output=capture_output,
+                stdout=stdout,
+                stderr=stderr,
+            )
+
+
+def prefixed_writer(prefix: str, stream: IO[str] | None = None) -> OutputCallback:
+    pending = bytearray()
+
+    def write(chunk: bytes) -> None:
+        pending.extend(chunk)
+        *lines, rest = pending.split(b"\n")
+        if len(lines) > 0:
+            target = sys.stderr if stream is None else stream
+            target.writelines(f"{prefix}{line.decode(errors='replace')}\n" for line in lines)
+            target.flush()
+            pending[:] = rest
+
+    return write
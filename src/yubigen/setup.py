@@ -1,3 +1,5 @@
+from typing import cast
+
 from click.termui import prompt
 from fido2.ctap2.base import Ctap2
 from fido2.ctap2.pin import ClientPin
@@ -5,26 +7,49 @@ from yubikit.core.fido import FidoConnection
 from yubikit.core.smartcard import SmartCardConnection
 from yubikit.openpgp import OpenPgpSession
 
+from yubigen.pins import PinSource
+from yubigen.trace import span
+
+DEFAULT_OPENPGP_PIN = "123456"
+DEFAULT_OPENPGP_ADMIN_PIN = "12345678"
+
+
+def prompt_pin(text: str, default: str | None = None, confirmation_prompt: bool = False) -> str:
+    with span("prompt", kind="human", text=text):
+        return cast(str, prompt(text, default, hide_input=True, confirmation_prompt=confirmation_prompt))
 
-def change_openpgp_admin_pin(connection_or_session: SmartCardConnection | OpenPgpSession):
+
+def change_openpgp_admin_pin(
+    connection_or_session: SmartCardConnection | OpenPgpSession,
+    admin_pin: str | None = None,
+    new_admin_pin: str | None = None,
+):
     session = OpenPgpSession(connection_or_session) if isinstance(connection_or_session, SmartCardConnection) else connection_or_session
 
     session.change_admin(
-        prompt("Enter Admin PIN", "12345678", hide_input=True),  # pyright: ignore[reportAny]
-        prompt("New Admin PIN", hide_input=True, confirmation_prompt=True),  # pyright: ignore[reportAny]
+        prompt_pin("Enter Admin PIN", DEFAULT_OPENPGP_ADMIN_PIN) if admin_pin is None else admin_pin,
+        prompt_pin("New Admin PIN", confirmation_prompt=True) if new_admin_pin is None else new_admin_pin,
     )
 
 
-def change_openpgp_pin(connection_or_session: SmartCardConnection | OpenPgpSession):
+def change_openpgp_pin(
+    connection_or_session: SmartCardConnection | OpenPgpSession,
+    pin: str | None = None,
+    new_pin: str | None = None,
+):
     session = OpenPgpSession(connection_or_session) if isinstance(connection_or_session, SmartCardConnection) else connection_or_session
 
     session.change_pin(
-        prompt("Enter PIN", "123456", hide_input=True),  # pyright: ignore[reportAny]
-        prompt("New PIN", hide_input=True, confirmation_prompt=True),  # pyright: ignore[reportAny]
+        prompt_pin("Enter PIN", DEFAULT_OPENPGP_PIN) if pin is None else pin,
+        prompt_pin("New PIN", confirmation_prompt=True) if new_pin is None else new_pin,
     )
 
 
-def change_fido_pin(client_pin_or_ctap2_or_connection: FidoConnection | Ctap2 | ClientPin):
+def change_fido_pin(
+    client_pin_or_ctap2_or_connection: FidoConnection | Ctap2 | ClientPin,
+    pin: str | None = None,
+    new_pin: str | None = None,
+):
     client_pin_or_ctap2 = (
         Ctap2(client_pin_or_ctap2_or_connection)
         if isinstance(client_pin_or_ctap2_or_connection, FidoConnection)
@@ -32,7 +57,44 @@ def change_fido_pin(client_pin_or_ctap2_or_connection: FidoConnection | Ctap2 |
     )
     client_pin = ClientPin(client_pin_or_ctap2) if isinstance(client_pin_or_ctap2, Ctap2) else client_pin_or_ctap2
 
+    if not client_pin.ctap.info.options.get("clientPin"):
+        client_pin.set_pin(prompt_pin("New PIN", confirmation_prompt=True) if new_pin is None else new_pin)
+        return
+
     client_pin.change_pin(
-        prompt("Enter PIN", "123456", hide_input=True),  # pyright: ignore[reportAny]
-        prompt("New PIN", hide_input=True, confirmation_prompt=True),  # pyright: ignore[reportAny]
+        prompt_pin("Enter PIN", "123456") if pin is None else pin,
+        prompt_pin("New PIN", confirmation_prompt=True) if new_pin is None else new_pin,
     )
+
+
+def apply_fido_pins(ctap: Ctap2, serial: int, source: PinSource) -> list[str]:
+    new_pin = source.get(serial, "fido", "new_pin")
+    if new_pin is None:
+        return []
+
+    client_pin = ClientPin(ctap)
+    pin = source.get(serial, "fido", "pin")
+    if pin is None and client_pin.ctap.info.options.get("clientPin"):
+        raise ValueError("FIDO PIN is set but no current PIN was provided")
+
+    with span("change_pin", serial, application="fido"):
+        change_fido_pin(client_pin, pin, new_pin)
+
+    return ["pin"]
+
+
+def apply_openpgp_pins(session: OpenPgpSession, serial: int, source: PinSource) -> list[str]:
+    changed: list[str] = []
+    new_pin = source.get(serial, "openpgp", "new_pin")
+    if new_pin is not None:
+        with span("change_pin", serial, application="openpgp"):
+            change_openpgp_pin(session, source.get(serial, "openpgp", "pin") or DEFAULT_OPENPGP_PIN, new_pin)
+        changed.append("pin")
+
+    new_admin_pin = source.get(serial, "openpgp", "new_admin_pin")
+    if new_admin_pin is not None:
+        with span("change_admin_pin", serial, application="openpgp"):
+            change_openpgp_admin_pin(session, source.get(serial, "openpgp", "admin_pin") or DEFAULT_OPENPGP_ADMIN_PIN, new_admin_pin)
+        changed.append("admin_pin")
+
+    return changed
@@ -0,0 +1,1054 @@
+from __future__ import annotations
+
+import base64
+import errno
+import fcntl
+import hmac
+import json
+import os
+import random
+import shutil
+import struct
+import time
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import Any, override
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa, x25519
+from fido2 import cbor
+from fido2.cose import ES256, CoseKey, EdDSA
+from fido2.ctap import CtapDevice, CtapError
+from fido2.ctap2.base import Ctap2
+from fido2.ctap2.credman import CredentialManagement
+from fido2.ctap2.pin import ClientPin, PinProtocol, PinProtocolV1, PinProtocolV2
+from fido2.hid import CAPABILITY as HID_CAPABILITY
+from fido2.hid import CTAPHID
+from fido2.utils import sha256
+from fido2.webauthn import Aaguid, AttestedCredentialData, AuthenticatorData
+from ykman.base import YkmanDevice
+from yubikit.core import PID, TRANSPORT, Tlv, Version
+from yubikit.core.fido import FidoConnection
+from yubikit.core.smartcard import SW, ApduError, SmartCardConnection
+from yubikit.management import CAPABILITY, FORM_FACTOR, DeviceConfig, DeviceInfo
+from yubikit.openpgp import (
+    DO,
+    EXTENDED_CAPABILITY_FLAGS,
+    INS,
+    KEY_REF,
+    KEY_STATUS,
+    OID,
+    PW,
+    RSA_IMPORT_FORMAT,
+    RSA_SIZE,
+    TAG_CA_FINGERPRINTS,
+    TAG_DISCRETIONARY,
+    TAG_EXTENDED_CAPABILITIES,
+    TAG_FINGERPRINTS,
+    TAG_GENERATION_TIMES,
+    TAG_KEY_INFORMATION,
+    TAG_PUBLIC_KEY,
+    TAG_SIGNATURE_COUNTER,
+    UIF,
+    AlgorithmAttributes,
+    CurveOid,
+    EcAttributes,
+    RsaAttributes,
+)
+
+from yubigen.backend import Backend
+from yubigen.core import programdirs
+
+SERIAL_BASE = 10000000
+FIRMWARE = Version(5, 7, 2)
+CAPABILITIES = {TRANSPORT.USB: CAPABILITY.OTP | CAPABILITY.U2F | CAPABILITY.FIDO2 | CAPABILITY.OPENPGP}
+
+AAGUID = Aaguid.parse("ee882879-721c-4913-9775-3dfcce97072a")
+FIDO_PIN_RETRIES = 8
+MAX_RESIDENT_CREDENTIALS = 100
+CREDENTIAL_ID_LENGTH = 64
+ALGORITHMS = [ES256.ALGORITHM, EdDSA.ALGORITHM]
+
+OPENPGP_AID = bytes.fromhex("D27600012401")
+OPENPGP_HISTORICAL = bytes.fromhex("0031C573C00140059000")
+OPENPGP_EXTENDED_CAPABILITIES = struct.pack(
+    ">BBHHHBB",
+    EXTENDED_CAPABILITY_FLAGS.KEY_IMPORT
+    | EXTENDED_CAPABILITY_FLAGS.PW_STATUS_CHANGEABLE
+    | EXTENDED_CAPABILITY_FLAGS.PRIVATE_USE
+    | EXTENDED_CAPABILITY_FLAGS.ALGORITHM_ATTRIBUTES_CHANGEABLE,
+    0,
+    0xFF,
+    0x800,
+    0xFF,
+    0,
+    1,
+)
+OPENPGP_PINS = {"user": "123456", "reset": None, "admin": "12345678"}
+OPENPGP_TRIES = {"user": 3, "reset": 0, "admin": 3}
+PW_NAMES = {PW.USER: "user", PW.RESET: "reset", PW.ADMIN: "admin"}
+CA_FINGERPRINTS = [DO.CA_FINGERPRINT_1, DO.CA_FINGERPRINT_2, DO.CA_FINGERPRINT_3, DO.CA_FINGERPRINT_4]
+CURVES = {
+    KEY_REF.SIG: [OID.SECP256R1, OID.SECP384R1, OID.SECP521R1, OID.BrainpoolP256R1, OID.BrainpoolP384R1, OID.BrainpoolP512R1, OID.Ed25519],
+    KEY_REF.DEC: [OID.SECP256R1, OID.SECP384R1, OID.SECP521R1, OID.BrainpoolP256R1, OID.BrainpoolP384R1, OID.BrainpoolP512R1, OID.X25519],
+    KEY_REF.AUT: [OID.SECP256R1, OID.SECP384R1, OID.SECP521R1, OID.BrainpoolP256R1, OID.BrainpoolP384R1, OID.BrainpoolP512R1, OID.Ed25519],
+    KEY_REF.ATT: [OID.SECP256R1, OID.SECP384R1, OID.SECP521R1, OID.BrainpoolP256R1, OID.BrainpoolP384R1, OID.BrainpoolP512R1, OID.Ed25519],
+}
+
+
+def encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def decode(data: str) -> bytes:
+    return base64.b64decode(data)
+
+
+def private_der(key: Any) -> str:  # pyright: ignore[reportAny, reportExplicitAny]
+    return encode(key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))  # pyright: ignore[reportAny]
+
+
+def load_private(data: str) -> Any:  # pyright: ignore[reportExplicitAny]
+    return serialization.load_der_private_key(decode(data), None)
+
+
+class SimState:
+    def __init__(self, path: Path, defaults: Callable[[], dict[str, Any]]) -> None:  # pyright: ignore[reportExplicitAny]
+        self.path: Path = path
+        self.defaults: Callable[[], dict[str, Any]] = defaults  # pyright: ignore[reportExplicitAny]
+
+        fd = os.open(path.with_suffix(".lock"), os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise OSError(errno.EBUSY, os.strerror(errno.EBUSY), str(path)) from None
+        self.fd: int | None = fd
+
+        try:
+            with open(path, "rb") as file:
+                self.data: dict[str, Any] = json.load(file)  # pyright: ignore[reportExplicitAny]
+        except FileNotFoundError:
+            self.data = defaults()
+            self.save()
+
+    def save(self) -> None:
+        path = self.path.with_name(f"{self.path.name}.new")
+        with open(path, "w", opener=lambda file, flags: os.open(file, flags, 0o600)) as file:
+            json.dump(self.data, file, indent=2)
+        _ = shutil.move(path, self.path)
+
+    def reset(self) -> None:
+        self.data = self.defaults()
+        self.save()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class SimFido:
+    def __init__(self, state: SimState) -> None:
+        self.state: SimState = state
+        self.key_agreement: ec.EllipticCurvePrivateKey | None = None
+        self.token: bytes | None = None
+        self.permissions: int = 0
+        self.permissions_rp: str | None = None
+        self.pending: list[Callable[[], dict[int, Any]]] = []  # pyright: ignore[reportExplicitAny]
+        self.commands: dict[int, Callable[[dict[int, Any]], dict[int, Any]]] = {  # pyright: ignore[reportExplicitAny]
+            Ctap2.CMD.MAKE_CREDENTIAL: self.make_credential,
+            Ctap2.CMD.GET_ASSERTION: self.get_assertion,
+            Ctap2.CMD.GET_INFO: self.get_info,
+            Ctap2.CMD.CLIENT_PIN: self.client_pin,
+            Ctap2.CMD.RESET: self.reset,
+            Ctap2.CMD.GET_NEXT_ASSERTION: self.next,
+            Ctap2.CMD.CREDENTIAL_MGMT: self.credential_mgmt,
+            Ctap2.CMD.SELECTION: lambda params: {},
+        }
+
+    @property
+    def data(self) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        return self.state.data
+
+    def call(self, request: bytes) -> bytes:
+        try:
+            command = self.commands.get(request[0]) if len(request) > 0 else None
+            if command is None:
+                raise CtapError(CtapError.ERR.INVALID_COMMAND)
+            params = cbor.decode(request[1:]) if len(request) > 1 else {}
+            if not isinstance(params, dict):
+                raise CtapError(CtapError.ERR.CBOR_UNEXPECTED_TYPE)
+            response = command(params)  # pyright: ignore[reportUnknownArgumentType]
+        except CtapError as e:
+            return struct.pack(">B", e.code)
+        except (KeyError, TypeError, ValueError):
+            return struct.pack(">B", CtapError.ERR.INVALID_PARAMETER)
+
+        return b"\x00" + (cbor.encode(response) if len(response) > 0 else b"")
+
+    def get_info(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        resident = sum(1 for credential in self.data["credentials"] if credential["resident"])  # pyright: ignore[reportAny]
+        return {
+            0x01: ["FIDO_2_0", "FIDO_2_1"],
+            0x02: ["credProtect"],
+            0x03: bytes(AAGUID),
+            0x04: {
+                "rk": True,
+                "up": True,
+                "plat": False,
+                "clientPin": self.data["pin"] is not None,
+                "credMgmt": True,
+                "pinUvAuthToken": True,
+                "makeCredUvNotRqd": True,
+            },
+            0x05: 1280,
+            0x06: [PinProtocolV2.VERSION, PinProtocolV1.VERSION],
+            0x07: 8,
+            0x08: 128,
+            0x09: ["usb"],
+            0x0A: [{"alg": algorithm, "type": "public-key"} for algorithm in ALGORITHMS],
+            0x14: MAX_RESIDENT_CREDENTIALS - resident,
+        }
+
+    def protocol(self, version: Any) -> PinProtocolV1:  # pyright: ignore[reportAny, reportExplicitAny]
+        if version is None:
+            raise CtapError(CtapError.ERR.MISSING_PARAMETER)
+        if version == PinProtocolV1.VERSION:
+            return PinProtocolV1()
+        if version == PinProtocolV2.VERSION:
+            return PinProtocolV2()
+
+        raise CtapError(CtapError.ERR.INVALID_PARAMETER)
+
+    def shared_secret(self, protocol: PinProtocolV1, peer: Any) -> bytes:  # pyright: ignore[reportAny, reportExplicitAny]
+        if peer is None:
+            raise CtapError(CtapError.ERR.MISSING_PARAMETER)
+        if self.key_agreement is None:
+            raise CtapError(CtapError.ERR.PIN_AUTH_INVALID)
+
+        public_key = ec.EllipticCurvePublicNumbers(
+            int.from_bytes(peer[-2]),  # pyright: ignore[reportAny]
+            int.from_bytes(peer[-3]),  # pyright: ignore[reportAny]
+            ec.SECP256R1(),
+        ).public_key()
+        return protocol.kdf(self.key_agreement.exchange(ec.ECDH(), public_key))
+
+    def verify(self, protocol: PinProtocol, key: bytes, message: bytes, signature: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        if not isinstance(signature, bytes) or not hmac.compare_digest(protocol.authenticate(key, message), signature):
+            raise CtapError(CtapError.ERR.PIN_AUTH_INVALID)
+
+    def check_pin(self, protocol: PinProtocol, shared_secret: bytes, pin_hash_enc: Any) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        if self.data["pin"] is None:
+            raise CtapError(CtapError.ERR.PIN_NOT_SET)
+        if self.data["retries"] < 1:
+            raise CtapError(CtapError.ERR.PIN_BLOCKED)
+
+        if not isinstance(pin_hash_enc, bytes) or not hmac.compare_digest(
+            protocol.decrypt(shared_secret, pin_hash_enc),
+            bytes.fromhex(self.data["pin"]),  # pyright: ignore[reportAny]
+        ):
+            self.data["retries"] -= 1
+            self.key_agreement = None
+            self.state.save()
+            raise CtapError(CtapError.ERR.PIN_BLOCKED if self.data["retries"] < 1 else CtapError.ERR.PIN_INVALID)
+
+        if self.data["retries"] != FIDO_PIN_RETRIES:
+            self.data["retries"] = FIDO_PIN_RETRIES
+            self.state.save()
+
+    def new_pin(self, protocol: PinProtocol, shared_secret: bytes, new_pin_enc: bytes) -> str:
+        pin = protocol.decrypt(shared_secret, new_pin_enc).rstrip(b"\x00")
+        if len(pin.decode()) < 4:
+            raise CtapError(CtapError.ERR.PIN_POLICY_VIOLATION)
+
+        return sha256(pin)[:16].hex()
+
+    def client_pin(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        protocol = self.protocol(params.get(0x01))
+        command = params.get(0x02)
+
+        if command == ClientPin.CMD.GET_PIN_RETRIES:
+            return {ClientPin.RESULT.PIN_RETRIES: self.data["retries"], ClientPin.RESULT.POWER_CYCLE_STATE: False}
+        if command == ClientPin.CMD.GET_KEY_AGREEMENT:
+            self.key_agreement = ec.generate_private_key(ec.SECP256R1())
+            numbers = self.key_agreement.public_key().public_numbers()
+            return {ClientPin.RESULT.KEY_AGREEMENT: {1: 2, 3: -25, -1: 1, -2: numbers.x.to_bytes(32), -3: numbers.y.to_bytes(32)}}
+
+        shared_secret = self.shared_secret(protocol, params.get(0x03))
+        if command == ClientPin.CMD.SET_PIN:
+            if self.data["pin"] is not None:
+                raise CtapError(CtapError.ERR.NOT_ALLOWED)
+            self.verify(protocol, shared_secret, params[0x05], params.get(0x04))  # pyright: ignore[reportAny]
+
+            self.data["pin"] = self.new_pin(protocol, shared_secret, params[0x05])  # pyright: ignore[reportAny]
+            self.data["retries"] = FIDO_PIN_RETRIES
+            self.state.save()
+            return {}
+        if command == ClientPin.CMD.CHANGE_PIN:
+            if self.data["pin"] is None:
+                raise CtapError(CtapError.ERR.PIN_NOT_SET)
+            self.verify(protocol, shared_secret, params[0x05] + params[0x06], params.get(0x04))  # pyright: ignore[reportAny]
+            self.check_pin(protocol, shared_secret, params[0x06])
+
+            self.data["pin"] = self.new_pin(protocol, shared_secret, params[0x05])  # pyright: ignore[reportAny]
+            self.token = None
+            self.state.save()
+            return {}
+        if command in [ClientPin.CMD.GET_TOKEN_USING_PIN_LEGACY, ClientPin.CMD.GET_TOKEN_USING_PIN]:
+            permissions = ClientPin.PERMISSION.MAKE_CREDENTIAL | ClientPin.PERMISSION.GET_ASSERTION
+            if command == ClientPin.CMD.GET_TOKEN_USING_PIN:
+                permissions = int(params.get(0x09) or 0)  # pyright: ignore[reportAny]
+                if permissions == 0:
+                    raise CtapError(CtapError.ERR.INVALID_PARAMETER)
+            self.check_pin(protocol, shared_secret, params.get(0x06))
+
+            self.token = os.urandom(32)
+            self.permissions = permissions
+            self.permissions_rp = params.get(0x0A)
+            return {ClientPin.RESULT.PIN_UV_TOKEN: protocol.encrypt(shared_secret, self.token)}
+
+        raise CtapError(CtapError.ERR.INVALID_SUBCOMMAND)
+
+    def authorize(self, version: Any, signature: Any, message: bytes, permission: int, rp_id: str | None = None) -> bool:  # pyright: ignore[reportAny, reportExplicitAny]
+        if signature is None:
+            return False
+        if self.token is None:
+            raise CtapError(CtapError.ERR.PIN_AUTH_INVALID)
+
+        self.verify(self.protocol(version), self.token, message, signature)
+        if not self.permissions & permission or (rp_id is not None and self.permissions_rp not in [None, rp_id]):
+            raise CtapError(CtapError.ERR.UNAUTHORIZED_PERMISSION)
+
+        return True
+
+    def counter(self) -> int:
+        self.data["counter"] += 1
+        return int(self.data["counter"])  # pyright: ignore[reportAny]
+
+    def public_key(self, credential: dict[str, Any]) -> CoseKey:  # pyright: ignore[reportExplicitAny]
+        return CoseKey.for_alg(credential["algorithm"]).from_cryptography_key(load_private(credential["key"]).public_key())  # pyright: ignore[reportAny]
+
+    def user(self, credential: dict[str, Any]) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        return {**credential["user"], "id": decode(credential["user"]["id"])}  # pyright: ignore[reportAny]
+
+    def make_credential(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        client_data_hash, rp, user, key_params = params.get(0x01), params.get(0x02), params.get(0x03), params.get(0x04)
+        if client_data_hash is None or rp is None or user is None or key_params is None:
+            raise CtapError(CtapError.ERR.MISSING_PARAMETER)
+
+        options = params.get(0x07) or {}
+        resident = bool(options.get("rk"))  # pyright: ignore[reportAny]
+        verified = self.authorize(params.get(0x09), params.get(0x08), client_data_hash, ClientPin.PERMISSION.MAKE_CREDENTIAL, rp["id"])  # pyright: ignore[reportAny]
+        if resident and not verified and self.data["pin"] is not None:
+            raise CtapError(CtapError.ERR.PUAT_REQUIRED)
+
+        algorithm = next((param["alg"] for param in key_params if param.get("alg") in ALGORITHMS), None)  # pyright: ignore[reportAny]
+        if algorithm is None:
+            raise CtapError(CtapError.ERR.UNSUPPORTED_ALGORITHM)
+
+        excluded = {bytes(descriptor["id"]) for descriptor in params.get(0x05) or []}  # pyright: ignore[reportAny]
+        if any(decode(credential["id"]) in excluded and credential["rp"]["id"] == rp["id"] for credential in self.data["credentials"]):  # pyright: ignore[reportAny]
+            raise CtapError(CtapError.ERR.CREDENTIAL_EXCLUDED)
+
+        extensions = params.get(0x06) or {}
+        protect = int(extensions.get("credProtect", 1))  # pyright: ignore[reportAny]
+        if resident:
+            self.data["credentials"] = [
+                credential
+                for credential in self.data["credentials"]  # pyright: ignore[reportAny]
+                if not (credential["resident"] and credential["rp"]["id"] == rp["id"] and decode(credential["user"]["id"]) == user["id"])
+            ]
+            if sum(1 for credential in self.data["credentials"] if credential["resident"]) >= MAX_RESIDENT_CREDENTIALS:  # pyright: ignore[reportAny]
+                raise CtapError(CtapError.ERR.KEY_STORE_FULL)
+
+        key = ec.generate_private_key(ec.SECP256R1()) if algorithm == ES256.ALGORITHM else ed25519.Ed25519PrivateKey.generate()
+        credential: dict[str, Any] = {  # pyright: ignore[reportExplicitAny]
+            "id": encode(os.urandom(CREDENTIAL_ID_LENGTH)),
+            "rp": rp,
+            "user": {**user, "id": encode(user["id"])},  # pyright: ignore[reportAny]
+            "algorithm": algorithm,
+            "key": private_der(key),
+            "resident": resident,
+            "protect": protect,
+        }
+        self.data["credentials"].append(credential)
+
+        flags = AuthenticatorData.FLAG.UP | AuthenticatorData.FLAG.AT
+        if verified:
+            flags |= AuthenticatorData.FLAG.UV
+        if "credProtect" in extensions:
+            flags |= AuthenticatorData.FLAG.ED
+        auth_data = AuthenticatorData.create(
+            sha256(str(rp["id"]).encode()),  # pyright: ignore[reportAny]
+            flags,
+            self.counter(),
+            AttestedCredentialData.create(bytes(AAGUID), decode(credential["id"]), self.public_key(credential)),
+            {"credProtect": protect} if "credProtect" in extensions else None,
+        )
+        self.state.save()
+
+        return {0x01: "none", 0x02: bytes(auth_data), 0x03: {}}
+
+    def assertion(
+        self,
+        credential: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+        client_data_hash: bytes,
+        flags: AuthenticatorData.FLAG,
+        count: int | None,
+    ) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        auth_data = bytes(AuthenticatorData.create(sha256(str(credential["rp"]["id"]).encode()), flags, self.counter()))  # pyright: ignore[reportAny]
+        key = load_private(credential["key"])  # pyright: ignore[reportAny]
+        if isinstance(key, ec.EllipticCurvePrivateKey):
+            signature = key.sign(auth_data + client_data_hash, ec.ECDSA(hashes.SHA256()))
+        else:
+            signature = key.sign(auth_data + client_data_hash)  # pyright: ignore[reportAny]
+        self.state.save()
+
+        response: dict[int, Any] = {0x01: {"type": "public-key", "id": decode(credential["id"])}, 0x02: auth_data, 0x03: signature}  # pyright: ignore[reportExplicitAny]
+        if credential["resident"]:
+            response[0x04] = self.user(credential)
+        if count is not None:
+            response[0x05] = count
+
+        return response
+
+    def get_assertion(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        rp_id, data_hash = params.get(0x01), params.get(0x02)
+        if rp_id is None or data_hash is None:
+            raise CtapError(CtapError.ERR.MISSING_PARAMETER)
+        client_data_hash = bytes(data_hash)  # pyright: ignore[reportAny]
+
+        options = params.get(0x05) or {}
+        verified = self.authorize(params.get(0x07), params.get(0x06), client_data_hash, ClientPin.PERMISSION.GET_ASSERTION, rp_id)
+        allowed = {bytes(descriptor["id"]) for descriptor in params.get(0x03) or []}  # pyright: ignore[reportAny]
+        credentials = [
+            credential
+            for credential in self.data["credentials"]  # pyright: ignore[reportAny]
+            if credential["rp"]["id"] == rp_id
+            and (decode(credential["id"]) in allowed if len(allowed) > 0 else credential["resident"])
+            and (verified or credential["protect"] < 3 and (credential["protect"] < 2 or len(allowed) > 0))
+        ]
+        if len(credentials) < 1:
+            raise CtapError(CtapError.ERR.NO_CREDENTIALS)
+
+        flags = AuthenticatorData.FLAG.UP if options.get("up", True) else AuthenticatorData.FLAG(0)  # pyright: ignore[reportAny]
+        if verified:
+            flags |= AuthenticatorData.FLAG.UV
+        self.pending = [
+            lambda credential=credential: self.assertion(credential, client_data_hash, flags, None)  # pyright: ignore[reportAny]
+            for credential in credentials[1:]
+        ]
+        count = len(credentials) if len(allowed) < 1 and len(credentials) > 1 else None
+        return self.assertion(credentials[0], client_data_hash, flags, count)
+
+    def next(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        if len(self.pending) < 1:
+            raise CtapError(CtapError.ERR.NOT_ALLOWED)
+
+        return self.pending.pop(0)()
+
+    def credential_entry(self, credential: dict[str, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        return {
+            CredentialManagement.RESULT.USER: self.user(credential),
+            CredentialManagement.RESULT.CREDENTIAL_ID: {"type": "public-key", "id": decode(credential["id"])},
+            CredentialManagement.RESULT.PUBLIC_KEY: self.public_key(credential),
+            CredentialManagement.RESULT.CRED_PROTECT: credential["protect"],
+        }
+
+    def credential_mgmt(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        command, command_params = params.get(0x01), params.get(0x02)
+        if command not in [CredentialManagement.CMD.ENUMERATE_RPS_NEXT, CredentialManagement.CMD.ENUMERATE_CREDS_NEXT]:
+            message = struct.pack(">B", command) + (cbor.encode(command_params) if command_params is not None else b"")
+            if not self.authorize(params.get(0x03), params.get(0x04), message, ClientPin.PERMISSION.CREDENTIAL_MGMT):
+                raise CtapError(CtapError.ERR.PUAT_REQUIRED)
+
+        resident = [credential for credential in self.data["credentials"] if credential["resident"]]  # pyright: ignore[reportAny]
+        if command == CredentialManagement.CMD.GET_CREDS_METADATA:
+            return {
+                CredentialManagement.RESULT.EXISTING_CRED_COUNT: len(resident),
+                CredentialManagement.RESULT.MAX_REMAINING_COUNT: MAX_RESIDENT_CREDENTIALS - len(resident),
+            }
+        if command == CredentialManagement.CMD.ENUMERATE_RPS_BEGIN:
+            rps = list({str(credential["rp"]["id"]): credential["rp"] for credential in resident}.values())  # pyright: ignore[reportAny]
+            if len(rps) < 1:
+                raise CtapError(CtapError.ERR.NO_CREDENTIALS)
+
+            entries: list[dict[int, Any]] = [  # pyright: ignore[reportExplicitAny]
+                {CredentialManagement.RESULT.RP: rp, CredentialManagement.RESULT.RP_ID_HASH: sha256(str(rp["id"]).encode())}  # pyright: ignore[reportAny]
+                for rp in rps  # pyright: ignore[reportAny]
+            ]
+            self.pending = [lambda entry=entry: entry for entry in entries[1:]]
+            return {**entries[0], CredentialManagement.RESULT.TOTAL_RPS: len(entries)}
+        if command == CredentialManagement.CMD.ENUMERATE_CREDS_BEGIN:
+            rp_id_hash = (command_params or {}).get(CredentialManagement.PARAM.RP_ID_HASH)
+            matches = [credential for credential in resident if sha256(str(credential["rp"]["id"]).encode()) == rp_id_hash]  # pyright: ignore[reportAny]
+            if len(matches) < 1:
+                raise CtapError(CtapError.ERR.NO_CREDENTIALS)
+
+            self.pending = [lambda credential=credential: self.credential_entry(credential) for credential in matches[1:]]  # pyright: ignore[reportAny]
+            return {**self.credential_entry(matches[0]), CredentialManagement.RESULT.TOTAL_CREDENTIALS: len(matches)}
+        if command in [CredentialManagement.CMD.ENUMERATE_RPS_NEXT, CredentialManagement.CMD.ENUMERATE_CREDS_NEXT]:
+            return self.next(params)
+        if command in [CredentialManagement.CMD.DELETE_CREDENTIAL, CredentialManagement.CMD.UPDATE_USER_INFO]:
+            id = encode(bytes(command_params[CredentialManagement.PARAM.CREDENTIAL_ID]["id"]))  # pyright: ignore[reportAny, reportOptionalSubscript]
+            credential = next((credential for credential in resident if credential["id"] == id), None)  # pyright: ignore[reportAny]
+            if credential is None:
+                raise CtapError(CtapError.ERR.NO_CREDENTIALS)
+
+            if command == CredentialManagement.CMD.DELETE_CREDENTIAL:
+                self.data["credentials"].remove(credential)
+            else:
+                user = command_params[CredentialManagement.PARAM.USER]  # pyright: ignore[reportAny, reportOptionalSubscript]
+                credential["user"] = {**user, "id": encode(user["id"])}  # pyright: ignore[reportAny]
+            self.state.save()
+            return {}
+
+        raise CtapError(CtapError.ERR.INVALID_SUBCOMMAND)
+
+    def reset(self, params: dict[int, Any]) -> dict[int, Any]:  # pyright: ignore[reportExplicitAny]
+        self.state.reset()
+        self.token = None
+        self.pending = []
+        return {}
+
+
+class SimOpenPgp:
+    def __init__(self, state: SimState, serial: int) -> None:
+        self.state: SimState = state
+        self.serial: int = serial
+        self.selected: bool = False
+        self.verified: set[int] = set()
+        self.chain: bytes = b""
+
+    @property
+    def data(self) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        return self.state.data
+
+    def process(self, apdu: bytes) -> tuple[bytes, int]:
+        cla, ins, p1, p2 = apdu[:4]
+        body = apdu[4:]
+        if len(body) <= 1:
+            data = b""
+        elif body[0] == 0 and len(body) >= 3:
+            data = body[3 : 3 + int.from_bytes(body[1:3])]
+        else:
+            data = body[1 : 1 + body[0]]
+
+        if cla & 0x10:
+            self.chain += data
+            return b"", SW.OK
+        data, self.chain = self.chain + data, b""
+
+        try:
+            return self.dispatch(ins, p1, p2, data), SW.OK
+        except ApduError as e:
+            return e.data, e.sw
+
+    def dispatch(self, ins: int, p1: int, p2: int, data: bytes) -> bytes:
+        if ins == 0xA4:
+            if p1 != 0x04 or not data.startswith(OPENPGP_AID):
+                raise ApduError(b"", SW.FILE_NOT_FOUND)
+            if self.data["terminated"]:
+                raise ApduError(b"", SW.CONDITIONS_NOT_SATISFIED)
+
+            self.selected = True
+            self.verified.clear()
+            return b""
+        if ins == INS.ACTIVATE:
+            if self.data["terminated"]:
+                self.state.reset()
+            return b""
+        if not self.selected:
+            raise ApduError(b"", SW.CONDITIONS_NOT_SATISFIED)
+
+        if ins == INS.GET_VERSION:
+            return bytes(int(str(part), 16) for part in FIRMWARE)
+        if ins == INS.GET_DATA:
+            return self.get_data(p1 << 8 | p2)
+        if ins == INS.VERIFY:
+            return self.verify(p1, p2, data)
+        if ins == INS.CHANGE_PIN:
+            return self.change_pin(p2, data)
+        if ins == INS.RESET_RETRY_COUNTER:
+            return self.reset_retry_counter(p1, data)
+        if ins == INS.PUT_DATA:
+            return self.put_data(p1 << 8 | p2, data)
+        if ins == INS.PUT_DATA_ODD:
+            return self.put_key(data)
+        if ins == INS.GENERATE_ASYM:
+            return self.generate(p1, data)
+        if ins == INS.SET_PIN_RETRIES:
+            return self.set_pin_retries(data)
+        if ins == INS.TERMINATE:
+            if self.data["remaining"]["admin"] > 0 and PW.ADMIN not in self.verified:
+                raise ApduError(b"", SW.SECURITY_CONDITION_NOT_SATISFIED)
+
+            self.data["terminated"] = True
+            self.state.save()
+            self.selected = False
+            return b""
+
+        raise ApduError(b"", SW.INVALID_INSTRUCTION)
+
+    def object(self, do: int, default: bytes = b"") -> bytes:
+        value = self.data["objects"].get(f"{do:X}")  # pyright: ignore[reportAny]
+        return default if value is None else bytes.fromhex(value)  # pyright: ignore[reportAny]
+
+    def attributes(self, key_ref: KEY_REF) -> bytes:
+        return self.object(key_ref.algorithm_attributes_do, bytes(RsaAttributes.create(RSA_SIZE.RSA2048, RSA_IMPORT_FORMAT.STANDARD)))
+
+    def pw_status(self) -> bytes:
+        remaining = self.data["remaining"]
+        return struct.pack(">BBBBBBB", self.data["policy"], 127, 127, 127, remaining["user"], remaining["reset"], remaining["admin"])  # pyright: ignore[reportAny]
+
+    def aid(self) -> bytes:
+        return OPENPGP_AID + bytes.fromhex(f"0304 0006 {self.serial % 10**8:08d} 0000")
+
+    def key_status(self, key_ref: KEY_REF) -> int:
+        key = self.data["keys"].get(str(key_ref.value))  # pyright: ignore[reportAny]
+        return KEY_STATUS.NONE if key is None else int(key["status"])  # pyright: ignore[reportAny]
+
+    def application_data(self) -> bytes:
+        discretionary = b"".join([
+            Tlv(TAG_EXTENDED_CAPABILITIES, OPENPGP_EXTENDED_CAPABILITIES),
+            *(Tlv(key_ref.algorithm_attributes_do, self.attributes(key_ref)) for key_ref in KEY_REF),
+            Tlv(DO.PW_STATUS_BYTES, self.pw_status()),
+            Tlv(TAG_FINGERPRINTS, b"".join(self.object(key_ref.fingerprint_do, bytes(20)) for key_ref in KEY_REF)),
+            Tlv(TAG_CA_FINGERPRINTS, b"".join(self.object(do, bytes(20)) for do in CA_FINGERPRINTS)),
+            Tlv(TAG_GENERATION_TIMES, b"".join(self.object(key_ref.generation_time_do, bytes(4)) for key_ref in KEY_REF)),
+            Tlv(TAG_KEY_INFORMATION, b"".join(struct.pack(">BB", key_ref, self.key_status(key_ref)) for key_ref in KEY_REF)),
+            *(Tlv(key_ref.uif_do, self.object(key_ref.uif_do, bytes(UIF.OFF))) for key_ref in KEY_REF),
+        ])
+
+        return Tlv(
+            DO.APPLICATION_RELATED_DATA,
+            Tlv(DO.AID, self.aid())
+            + Tlv(DO.HISTORICAL_BYTES, OPENPGP_HISTORICAL)
+            + Tlv(DO.EXTENDED_LENGTH_INFO, Tlv(0x02, b"\x08\x00") + Tlv(0x02, b"\x08\x00"))
+            + Tlv(DO.GENERAL_FEATURE_MANAGEMENT, Tlv(0x81, b"\x20"))
+            + Tlv(TAG_DISCRETIONARY, discretionary),
+        )
+
+    def algorithm_information(self) -> bytes:
+        attributes: list[bytes] = []
+        for key_ref in KEY_REF:
+            attributes.extend(Tlv(key_ref.algorithm_attributes_do, bytes(RsaAttributes.create(size))) for size in RSA_SIZE)
+            attributes.extend(Tlv(key_ref.algorithm_attributes_do, bytes(EcAttributes.create(key_ref, oid))) for oid in CURVES[key_ref])
+
+        return Tlv(DO.ALGORITHM_INFORMATION, b"".join(attributes))
+
+    def get_data(self, do: int) -> bytes:
+        if do == DO.APPLICATION_RELATED_DATA:
+            return self.application_data()
+        if do == DO.PW_STATUS_BYTES:
+            return self.pw_status()
+        if do == DO.AID:
+            return self.aid()
+        if do == DO.HISTORICAL_BYTES:
+            return OPENPGP_HISTORICAL
+        if do == DO.ALGORITHM_INFORMATION:
+            return self.algorithm_information()
+        if do == DO.SECURITY_SUPPORT_TEMPLATE:
+            return Tlv(DO.SECURITY_SUPPORT_TEMPLATE, Tlv(TAG_SIGNATURE_COUNTER, struct.pack(">I", self.data["signatures"])[1:]))
+        if do == DO.CARDHOLDER_RELATED_DATA:
+            return Tlv(
+                DO.CARDHOLDER_RELATED_DATA,
+                Tlv(DO.NAME, self.object(DO.NAME)) + Tlv(DO.LANGUAGE, self.object(DO.LANGUAGE)) + Tlv(DO.SEX, self.object(DO.SEX, b"\x39")),
+            )
+        if f"{do:X}" in self.data["objects"]:
+            return self.object(do)
+        if do in [DO.NAME, DO.LOGIN_DATA, DO.URL, DO.PRIVATE_USE_1, DO.PRIVATE_USE_2, DO.PRIVATE_USE_3, DO.PRIVATE_USE_4]:
+            return b""
+
+        raise ApduError(b"", SW.REFERENCE_DATA_NOT_FOUND)
+
+    def check(self, name: str, value: bytes) -> None:
+        remaining = self.data["remaining"]
+        pin = self.data["pins"][name]
+        if pin is None or remaining[name] < 1:
+            raise ApduError(b"", SW.AUTH_METHOD_BLOCKED)
+
+        if not hmac.compare_digest(bytes.fromhex(pin), value):  # pyright: ignore[reportAny]
+            remaining[name] -= 1
+            self.state.save()
+            raise ApduError(b"", SW.AUTH_METHOD_BLOCKED if remaining[name] < 1 else SW.SECURITY_CONDITION_NOT_SATISFIED)
+
+        if remaining[name] != self.data["tries"][name]:
+            remaining[name] = self.data["tries"][name]
+            self.state.save()
+
+    def require_admin(self) -> None:
+        if PW.ADMIN not in self.verified:
+            raise ApduError(b"", SW.SECURITY_CONDITION_NOT_SATISFIED)
+
+    def verify(self, p1: int, p2: int, data: bytes) -> bytes:
+        if p2 not in [PW.USER, PW.RESET, PW.ADMIN]:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS)
+        if p1 == 0xFF:
+            self.verified.discard(p2)
+            return b""
+
+        name = "admin" if p2 == PW.ADMIN else "user"
+        if len(data) < 1:
+            if p2 in self.verified:
+                return b""
+            raise ApduError(b"", SW.VERIFY_FAIL_NO_RETRY | self.data["remaining"][name])
+
+        self.check(name, data)
+        self.verified.add(p2)
+        return b""
+
+    def change_pin(self, p2: int, data: bytes) -> bytes:
+        if p2 not in [PW.USER, PW.ADMIN]:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS)
+
+        name = PW_NAMES[PW(p2)]
+        length = len(bytes.fromhex(self.data["pins"][name]))  # pyright: ignore[reportAny]
+        self.check(name, data[:length])
+
+        self.data["pins"][name] = data[length:].hex()
+        self.verified.discard(p2)
+        self.state.save()
+        return b""
+
+    def reset_retry_counter(self, p1: int, data: bytes) -> bytes:
+        if p1 == 0x02:
+            self.require_admin()
+        elif p1 == 0x00 and self.data["pins"]["reset"] is not None:
+            length = len(bytes.fromhex(self.data["pins"]["reset"]))  # pyright: ignore[reportAny]
+            self.check("reset", data[:length])
+            data = data[length:]
+        else:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS)
+
+        self.data["pins"]["user"] = data.hex()
+        self.data["remaining"]["user"] = self.data["tries"]["user"]
+        self.state.save()
+        return b""
+
+    def put_data(self, do: int, data: bytes) -> bytes:
+        self.require_admin()
+
+        if do == DO.PW_STATUS_BYTES:
+            self.data["policy"] = data[0]
+        elif do == DO.RESETTING_CODE:
+            self.data["pins"]["reset"] = data.hex() if len(data) > 0 else None
+            self.data["tries"]["reset"] = self.data["remaining"]["reset"] = OPENPGP_TRIES["admin"] if len(data) > 0 else 0
+        else:
+            self.data["objects"][f"{do:X}"] = data.hex()
+        self.state.save()
+        return b""
+
+    def key_ref(self, crt: bytes) -> KEY_REF:
+        key_ref = next((key_ref for key_ref in KEY_REF if bytes(key_ref.crt) == crt), None)
+        if key_ref is None:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS)
+
+        return key_ref
+
+    def public_key(self, key_ref: KEY_REF, key: Any) -> bytes:  # pyright: ignore[reportAny, reportExplicitAny]
+        public_key = key.public_key()  # pyright: ignore[reportAny]
+        if isinstance(public_key, rsa.RSAPublicKey):
+            numbers = public_key.public_numbers()
+            value = Tlv(0x81, numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8)) + Tlv(0x82, numbers.e.to_bytes(3))
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            value = Tlv(0x86, public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint))
+        else:
+            value = Tlv(0x86, public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw))  # pyright: ignore[reportAny]
+
+        return Tlv(TAG_PUBLIC_KEY, value)
+
+    def store_key(self, key_ref: KEY_REF, key: Any, status: KEY_STATUS) -> None:  # pyright: ignore[reportAny, reportExplicitAny]
+        self.data["keys"][str(key_ref.value)] = {"status": int(status), "key": private_der(key)}
+        self.state.save()
+
+    def generate(self, p1: int, data: bytes) -> bytes:
+        key_ref = self.key_ref(data)
+        if p1 == 0x81:
+            key = self.data["keys"].get(str(key_ref.value))  # pyright: ignore[reportAny]
+            if key is None:
+                raise ApduError(b"", SW.REFERENCE_DATA_NOT_FOUND)
+            return self.public_key(key_ref, load_private(key["key"]))  # pyright: ignore[reportAny]
+        if p1 != 0x80:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS)
+        self.require_admin()
+
+        attributes = AlgorithmAttributes.parse(self.attributes(key_ref))
+        if isinstance(attributes, RsaAttributes):
+            key = rsa.generate_private_key(65537, attributes.n_len)
+        elif isinstance(attributes, EcAttributes) and attributes.oid == OID.Ed25519:
+            key = ed25519.Ed25519PrivateKey.generate()
+        elif isinstance(attributes, EcAttributes) and attributes.oid == OID.X25519:
+            key = x25519.X25519PrivateKey.generate()
+        elif isinstance(attributes, EcAttributes):
+            key = ec.generate_private_key(getattr(ec, attributes.oid._get_name())())  # pyright: ignore[reportAny, reportPrivateUsage]
+        else:
+            raise ApduError(b"", SW.CONDITIONS_NOT_SATISFIED)
+
+        self.store_key(key_ref, key, KEY_STATUS.GENERATED)
+        return self.public_key(key_ref, key)
+
+    def put_key(self, data: bytes) -> bytes:
+        self.require_admin()
+
+        try:
+            crt, headers, values = Tlv.parse_list(Tlv.unpack(0x4D, data))
+        except ValueError:
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS) from None
+        key_ref = self.key_ref(bytes(crt))
+
+        fields: dict[int, bytes] = {}
+        offset = 0
+        for tag, length in template_headers(headers.value):
+            fields[tag] = values.value[offset : offset + length]
+            offset += length
+
+        attributes = AlgorithmAttributes.parse(self.attributes(key_ref))
+        try:
+            if isinstance(attributes, RsaAttributes):
+                key = rsa_private_key(*(int.from_bytes(fields[tag]) for tag in [0x91, 0x92, 0x93]))
+            elif isinstance(attributes, EcAttributes):
+                key = ec_private_key(attributes.oid, fields[0x92])
+            else:
+                raise ApduError(b"", SW.CONDITIONS_NOT_SATISFIED)
+        except (KeyError, ValueError):
+            raise ApduError(b"", SW.INCORRECT_PARAMETERS) from None
+
+        self.store_key(key_ref, key, KEY_STATUS.IMPORTED)
+        return b""
+
+    def set_pin_retries(self, data: bytes) -> bytes:
+        self.require_admin()
+        if len(data) != 3:
+            raise ApduError(b"", SW.WRONG_LENGTH)
+
+        for name, tries in zip(["user", "reset", "admin"], data):
+            self.data["tries"][name] = tries
+            self.data["remaining"][name] = tries if self.data["pins"][name] is not None else 0
+        self.state.save()
+        return b""
+
+
+def template_headers(data: bytes) -> Iterator[tuple[int, int]]:
+    offset = 0
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+        if tag & 0x1F == 0x1F:
+            tag = tag << 8 | data[offset]
+            offset += 1
+
+        length = data[offset]
+        offset += 1
+        if length & 0x80:
+            size = length & 0x7F
+            length = int.from_bytes(data[offset : offset + size])
+            offset += size
+
+        yield tag, length
+
+
+def rsa_private_key(e: int, p: int, q: int) -> rsa.RSAPrivateKey:
+    d = pow(e, -1, (p - 1) * (q - 1))
+    return rsa.RSAPrivateNumbers(
+        p,
+        q,
+        d,
+        rsa.rsa_crt_dmp1(d, p),
+        rsa.rsa_crt_dmq1(d, q),
+        rsa.rsa_crt_iqmp(p, q),
+        rsa.RSAPublicNumbers(e, p * q),
+    ).private_key()
+
+
+def ec_private_key(oid: CurveOid, value: bytes) -> Any:  # pyright: ignore[reportExplicitAny]
+    if oid == OID.Ed25519:
+        return ed25519.Ed25519PrivateKey.from_private_bytes(value)
+    if oid == OID.X25519:
+        return x25519.X25519PrivateKey.from_private_bytes(value[::-1])
+
+    return ec.derive_private_key(int.from_bytes(value), getattr(ec, oid._get_name())())  # pyright: ignore[reportAny, reportPrivateUsage]
+
+
+class SimFidoConnection(CtapDevice):
+    def __init__(self, backend: SimBackend, state: SimState) -> None:
+        self.backend: SimBackend = backend
+        self.app: SimFido = SimFido(state)
+
+    @property
+    @override
+    def capabilities(self) -> int:
+        return HID_CAPABILITY.CBOR | HID_CAPABILITY.NMSG
+
+    @override
+    def call(self, cmd: int, data: bytes = b"", event: Any = None, on_keepalive: Any = None) -> bytes:  # pyright: ignore[reportAny, reportExplicitAny]
+        self.backend.delay()
+        if cmd != CTAPHID.CBOR:
+            raise CtapError(CtapError.ERR.INVALID_COMMAND)
+
+        return self.app.call(data)
+
+    @override
+    def close(self) -> None:
+        self.app.state.close()
+
+    @classmethod
+    @override
+    def list_devices(cls) -> Iterator[CtapDevice]:
+        return iter([])
+
+
+class SimSmartCardConnection(SmartCardConnection):
+    def __init__(self, backend: SimBackend, state: SimState, serial: int) -> None:
+        self.backend: SimBackend = backend
+        self.app: SimOpenPgp = SimOpenPgp(state, serial)
+
+    @property
+    @override
+    def transport(self) -> TRANSPORT:
+        return TRANSPORT.USB
+
+    @override
+    def send_and_receive(self, apdu: bytes) -> tuple[bytes, int]:
+        self.backend.delay()
+        return self.app.process(apdu)
+
+    @override
+    def close(self) -> None:
+        self.app.state.close()
+
+
+class SimDevice(YkmanDevice):
+    def __init__(self, backend: SimBackend, kind: str, serial: int) -> None:
+        fingerprint = str(backend.device_path(serial).joinpath("hidraw")) if kind == "ctap" else f"Simulated YubiKey {serial}"
+        super().__init__(TRANSPORT.USB, fingerprint, PID.YK4_OTP_FIDO_CCID)
+        self.backend: SimBackend = backend
+        self.serial: int = serial
+
+    @override
+    def supports_connection(self, connection_type: type) -> bool:
+        return issubclass(connection_type, (FidoConnection, SmartCardConnection))
+
+    @override
+    def open_connection(self, connection_type: type) -> Any:  # pyright: ignore[reportIncompatibleMethodOverride, reportExplicitAny]
+        return self.backend.open(self.serial, connection_type)
+
+
+class SimBackend(Backend):
+    name: str = "sim"
+
+    def __init__(self, count: int, path: Path, latency: float = 0.0, errors: float = 0.0, ssh: Iterable[str] = ()) -> None:
+        self.count: int = count
+        self.path: Path = path.absolute()
+        self.latency: float = latency
+        self.errors: float = errors
+        self.ssh: list[str] = list(ssh)
+
+    @classmethod
+    def from_spec(cls, argument: str) -> SimBackend:
+        if not argument.isdigit() or int(argument) < 1:
+            raise ValueError(f"Invalid simulated device count '{argument}'")
+
+        path = os.environ.get("YUBIGEN_SIM_DIR")
+        try:
+            latency = float(os.environ.get("YUBIGEN_SIM_LATENCY") or 0)
+            errors = float(os.environ.get("YUBIGEN_SIM_ERRORS") or 0)
+        except ValueError:
+            raise ValueError("YUBIGEN_SIM_LATENCY and YUBIGEN_SIM_ERRORS must be numbers") from None
+
+        return cls(
+            int(argument),
+            Path(path) if path else programdirs.user_state_path.joinpath("sim"),
+            latency,
+            errors,
+            (application for application in os.environ.get("YUBIGEN_SIM_SSH", "").split(",") if application),
+        )
+
+    def delay(self) -> None:
+        if self.latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    def device_path(self, serial: int) -> Path:
+        return self.path.joinpath(str(serial))
+
+    def fido_defaults(self) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        credentials: list[dict[str, Any]] = []  # pyright: ignore[reportExplicitAny]
+        for application in self.ssh:
+            credentials.append({
+                "id": encode(os.urandom(CREDENTIAL_ID_LENGTH)),
+                "rp": {"id": f"ssh:{application}"},
+                "user": {"id": encode(bytes(1)), "name": "openssh"},
+                "algorithm": EdDSA.ALGORITHM,
+                "key": private_der(ed25519.Ed25519PrivateKey.generate()),
+                "resident": True,
+                "protect": 1,
+            })
+
+        return {"pin": None, "retries": FIDO_PIN_RETRIES, "counter": 0, "credentials": credentials}
+
+    def openpgp_defaults(self) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        return {
+            "pins": {name: None if pin is None else pin.encode().hex() for name, pin in OPENPGP_PINS.items()},
+            "tries": dict(OPENPGP_TRIES),
+            "remaining": dict(OPENPGP_TRIES),
+            "policy": 1,
+            "signatures": 0,
+            "objects": {},
+            "keys": {},
+            "terminated": False,
+        }
+
+    @override
+    def list_devices(self, kind: str) -> list[YkmanDevice]:
+        if kind == "otp":
+            return []
+
+        devices: list[YkmanDevice] = []
+        for serial in range(SERIAL_BASE, SERIAL_BASE + self.count):
+            path = self.device_path(serial)
+            if not path.exists():
+                for parent in reversed(path.parents):
+                    parent.mkdir(0o700, exist_ok=True)
+                path.mkdir(0o700, exist_ok=True)
+                path.joinpath("hidraw").touch(0o600)
+            devices.append(SimDevice(self, kind, serial))
+
+        return devices
+
+    @override
+    def read_info(self, device: YkmanDevice, connection: type[Any]) -> DeviceInfo:  # pyright: ignore[reportExplicitAny]
+        assert isinstance(device, SimDevice)
+
+        with device.open_connection(connection):
+            return DeviceInfo(
+                config=DeviceConfig(dict(CAPABILITIES)),
+                serial=device.serial,
+                version=FIRMWARE,
+                form_factor=FORM_FACTOR.USB_A_KEYCHAIN,
+                supported_capabilities=dict(CAPABILITIES),
+                is_locked=False,
+            )
+
+    @override
+    def stamp(self, kind: str, fingerprint: str) -> object:
+        return (self.name, str(self.path), self.count)
+
+    @override
+    def serial_hint(self, kind: str, fingerprint: str) -> int | None:
+        name = Path(fingerprint).parent.name if kind == "ctap" else fingerprint.rpartition(" ")[2]
+        return int(name) if name.isdigit() else None
+
+    def open(self, serial: int, connection_type: type) -> SimFidoConnection | SimSmartCardConnection:
+        self.delay()
+        if self.errors > 0 and random.random() < self.errors:
+            raise OSError(errno.EBUSY, "Device or resource busy (simulated)", str(self.device_path(serial)))
+
+        path = self.device_path(serial)
+        if issubclass(connection_type, SmartCardConnection):
+            return SimSmartCardConnection(self, SimState(path.joinpath("openpgp.json"), self.openpgp_defaults), serial)
+        if issubclass(connection_type, FidoConnection):
+            return SimFidoConnection(self, SimState(path.joinpath("fido.json"), self.fido_defaults))
+
+        raise ValueError(f"Unsupported connection type {connection_type.__name__}")
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.path: Path | None = None
+        self.format: str = "chrome"
+        self.events: list[dict[str, Any]] = []  # pyright: ignore[reportExplicitAny]
+        self.lock: threading.Lock = threading.Lock()
+        self.origin: int = time.perf_counter_ns()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def configure(self, path: Path, format: str | None = None) -> None:
+        self.path = path
+        self.format = format if format is not None else "jsonl" if path.suffix in [".jsonl", ".ndjson"] else "chrome"
+        self.origin = time.perf_counter_ns()
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        serial: int | None = None,
+        kind: str = "machine",
+        **args: Any,  # pyright: ignore[reportAny, reportExplicitAny]
+    ) -> Generator[dict[str, Any], None, None]:  # pyright: ignore[reportExplicitAny]
+        if self.path is None:
+            yield args
+            return
+
+        if serial is not None:
+            args["serial"] = serial
+
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                "name": name,
+                "kind": kind,
+                "start_us": (start - self.origin) // 1000,
+                "duration_us": (end - start) // 1000,
+                "thread": threading.current_thread().name,
+                "tid": threading.get_native_id(),
+                "args": args,
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def write(self) -> None:
+        if self.path is None:
+            return
+
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["start_us"])  # pyright: ignore[reportAny]
+
+        with open(self.path, "w") as file:
+            if self.format == "jsonl":
+                for event in events:
+                    _ = file.write(json.dumps(event, default=str) + "\n")
+                return
+
+            pid = os.getpid()
+            json.dump(
+                {
+                    "traceEvents": [
+                        {
+                            "name": event["name"],
+                            "cat": event["kind"],
+                            "ph": "X",
+                            "ts": event["start_us"],
+                            "dur": event["duration_us"],
+                            "pid": pid,
+                            "tid": event["tid"],
+                            "args": event["args"],
+                        }
+                        for event in events
+                    ],
+                    "displayTimeUnit": "ms",
+                },
+                file,
+                default=str,
+            )
+
+
+tracer = Tracer()
+span = tracer.span
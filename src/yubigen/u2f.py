@@ -1,12 +1,206 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import os
+import shutil
+import socket
 from collections import deque
-from collections.abc import Iterable
-from yubikit.core.fido import FidoConnection
-from yubikit.management import CAPABILITY
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Self, override
+
+from yubigen.core import fsync_paths, prompt_queue
+from yubigen.module import Module, fido_connection
+from yubigen.process import ProcessRunner
+from yubigen.trace import span
+
+if TYPE_CHECKING:
+    from fido2.ctap2.base import Ctap2
+
+
+MODULE = Module("U2F", fido_connection, "FIDO2")
+
+
+def default_origin() -> str:
+    return f"pam://{socket.gethostname()}"
+
+
+def default_authfile() -> Path:
+    return Path(os.environ.get("XDG_CONFIG_HOME") or Path.home().joinpath(".config")).joinpath("Yubico", "u2f_keys")
+
+
+def decode_key_handle(key_handle: str) -> bytes:
+    try:
+        return base64.b64decode(key_handle, validate=True)
+    except binascii.Error:
+        return base64.urlsafe_b64decode(key_handle + "=" * (-len(key_handle) % 4))
+
+
+class U2fCredential:
+    def __init__(self, key_handle: str, public_key: str, cose_type: str = "es256", options: str = "+presence") -> None:
+        self.key_handle: str = key_handle
+        self.public_key: str = public_key
+        self.cose_type: str = cose_type
+        self.options: str = options
+        self.text: str | None = None
+
+    @classmethod
+    def parse(cls, text: str) -> Self:
+        fields = text.strip().split(",")
+        if len(fields) < 2:
+            raise ValueError(f"Malformed pam_u2f credential '{text}'")
+
+        credential = cls(fields[0], fields[1], fields[2] if len(fields) > 2 else "es256", fields[3] if len(fields) > 3 else "")
+        credential.text = text.strip()
+        return credential
+
+    @override
+    def __str__(self) -> str:
+        return self.text if self.text is not None else ",".join([self.key_handle, self.public_key, self.cose_type, self.options])
+
+
+class AuthFile:
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self.users: dict[str, dict[str, U2fCredential]] = {}
+        self.key_handles: dict[str, U2fCredential] = {}
+        self.layout: list[tuple[str | None, str]] = []
+        self.lock: Lock = Lock()
+        self.changed: bool = False
+
+    def load(self) -> Self:
+        try:
+            with open(self.path) as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return self
+
+        for line in lines:
+            user, _, rest = line.strip().partition(":")
+            if len(user) < 1 or user.startswith("#"):
+                self.layout.append((None, line))
+                continue
+
+            if user not in self.users:
+                self.layout.append((user, ""))
+            credentials = self.users.setdefault(user, {})
+            for text in filter(None, rest.split(":")):
+                credential = U2fCredential.parse(text)
+                if credential.key_handle in credentials:
+                    self.changed = True
+                credentials.setdefault(credential.key_handle, credential)
+                self.key_handles.setdefault(credential.key_handle, credential)
 
-from yubigen.module import Module
+        return self
 
+    def add(self, user: str, credential: U2fCredential) -> bool:
+        with self.lock:
+            credentials = self.users.setdefault(user, {})
+            if credential.key_handle in credentials:
+                return False
 
-MODULE = Module("U2F", FidoConnection, CAPABILITY.FIDO2)
+            credentials[credential.key_handle] = credential
+            self.key_handles.setdefault(credential.key_handle, credential)
+            self.changed = True
+            return True
+
+    def write(self, sync: bool = True) -> bool:
+        with self.lock:
+            if not self.changed:
+                return False
+
+            for parent in reversed(self.path.parents):
+                parent.mkdir(0o700, exist_ok=True)
+            try:
+                mode = self.path.stat().st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o600
+
+            path = self.path.with_name(f"{self.path.name}.new")
+            with open(path, "w", opener=lambda file, flags: os.open(file, flags, mode)) as file:
+                placed = {user for user, _ in self.layout if user is not None}
+                for user, line in [*self.layout, *((user, "") for user in self.users if user not in placed)]:
+                    if user is None:
+                        _ = file.write(line + "\n")
+                    elif len(credentials := self.users[user]) > 0:
+                        _ = file.write(":".join([user, *map(str, credentials.values())]) + "\n")
+            path.chmod(mode)
+            if sync:
+                fsync_paths([path])
+            _ = shutil.move(path, self.path)
+            if sync:
+                fsync_paths([self.path.parent])
+
+            self.changed = False
+            return True
+
+
+def find_credential(ctap: Ctap2, origin: str, key_handles: Iterable[str]) -> str | None:
+    from fido2.ctap import CtapError
+
+    handles = {decode_key_handle(key_handle): key_handle for key_handle in key_handles}
+    ids = list(handles)
+    limit = max(ctap.info.max_creds_in_list, 1)
+    for index in range(0, len(ids), limit):
+        allow_list: list[Mapping[str, object]] = [{"type": "public-key", "id": id} for id in ids[index : index + limit]]
+        try:
+            assertion = ctap.get_assertion(origin, os.urandom(32), allow_list, options={"up": False})
+        except CtapError as e:
+            if e.code == CtapError.ERR.NO_CREDENTIALS:
+                continue
+            raise
+
+        credential_id = bytes(assertion.credential["id"])  # pyright: ignore[reportAny]
+        return handles.get(credential_id)
+
+
+def make_credential(
+    ctap: Ctap2,
+    origin: str,
+    user: str,
+    pin: str | None = None,
+    serial: int | None = None,
+) -> U2fCredential:
+    from fido2.cose import ES256, EdDSA
+    from fido2.ctap2.pin import ClientPin
+
+    client_data_hash = os.urandom(32)
+    pin_uv_param = pin_uv_protocol = None
+    if pin is not None:
+        client_pin = ClientPin(ctap)
+        with span("get_pin_token", serial):
+            token = client_pin.get_pin_token(pin, ClientPin.PERMISSION.MAKE_CREDENTIAL, origin)
+        pin_uv_param = client_pin.protocol.authenticate(token, client_data_hash)
+        pin_uv_protocol = client_pin.protocol.VERSION
+
+    prompt_queue.notify(f"[SN {serial}] Touch your YubiKey to register it for {origin}")
+    with span("make_credential", serial, "human"):
+        response = ctap.make_credential(
+            client_data_hash,
+            {"id": origin, "name": origin},
+            {"id": os.urandom(32), "name": user, "displayName": user},
+            [{"type": "public-key", "alg": ES256.ALGORITHM}, {"type": "public-key", "alg": EdDSA.ALGORITHM}],
+            options={"rk": False},
+            pin_uv_param=pin_uv_param,
+            pin_uv_protocol=pin_uv_protocol,
+        )
+
+    credential_data = response.auth_data.credential_data
+    assert credential_data is not None
+    public_key = credential_data.public_key
+    if public_key[3] == EdDSA.ALGORITHM:  # pyright: ignore[reportAny]
+        cose_type, raw = "eddsa", bytes(public_key[-2])  # pyright: ignore[reportAny]
+    else:
+        cose_type, raw = "es256", bytes(public_key[-2]) + bytes(public_key[-3])  # pyright: ignore[reportAny]
+
+    return U2fCredential(
+        base64.b64encode(credential_data.credential_id).decode(),
+        base64.b64encode(raw).decode(),
+        cose_type,
+        "+presence" + ("+pin" if pin is not None else ""),
+    )
 
 
 def build_pamu2fcfg_args(
@@ -22,3 +216,20 @@ def build_pamu2fcfg_args(
 
     call.appendleft(bin)
     return call
+
+
+async def run_pamu2fcfg(
+    args: Iterable[str] | None = None,
+    user: bool = False,
+    /,
+    env: Mapping[str, str] | None = None,
+    runner: ProcessRunner | None = None,
+) -> str:
+    result = await (ProcessRunner() if runner is None else runner).run(
+        build_pamu2fcfg_args(args, user),
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+
+    return result.stdout.decode()